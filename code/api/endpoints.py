@@ -0,0 +1,181 @@
+import os
+import sys
+import json
+import queue
+import asyncio
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Union
+
+from fastapi import Body, FastAPI, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+
+CODE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRC_DIR = os.path.join(CODE_DIR, "src")
+# The pipeline modules import each other as top-level modules (they are normally run from code/src)
+for path in (CODE_DIR, SRC_DIR):
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+from config import config_by_name
+from main import iter_screening_results, convert_text_to_transactions
+from batch_screening import BATCH_CHUNK_SIZE, screen_chunk
+from model_registry import warm_up
+from transaction_io import chunked
+from model_workers import start_model_workers, stop_model_workers
+from api.jobs import FINISHED, JobQueue, JobStore, sqlite_path_from_uri
+
+config = config_by_name[os.getenv("APP_ENV", "production")]
+
+# Blocking pipeline calls in flight at once; each one already fans out to its own stage threads
+API_WORKERS = int(os.getenv("API_WORKERS", "4"))
+API_MAX_BATCH_SIZE = int(os.getenv("API_MAX_BATCH_SIZE", "1000"))
+# How often an event stream checks the job store for new progress
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "0.5"))
+# Suggested wait before resubmitting when the job queue is full
+JOB_RETRY_AFTER = int(os.getenv("JOB_RETRY_AFTER", "30"))
+
+Transaction = Union[Dict[str, Any], str]
+
+def single_transaction(transaction):
+    """Validate a one-transaction request and return the transaction; raises ValueError for bad input."""
+    if not isinstance(transaction, str):
+        return transaction
+    if not transaction.strip():
+        raise ValueError("Empty transaction")
+    try:
+        transactions = convert_text_to_transactions(transaction)
+    except ValueError:
+        # Not JSON: free-text transaction details, which extraction parses itself
+        return transaction
+    if len(transactions) != 1:
+        raise ValueError("Expected exactly one transaction; use /screen/batch for several")
+    return transactions[0]
+
+def validate_batch(transactions):
+    if not transactions:
+        raise ValueError("Expected at least one transaction")
+
+def screen_one(transaction, progress=None):
+    """Screen a transaction already checked by single_transaction."""
+    _, final_output = next(iter_screening_results([transaction], progress))
+    return final_output
+
+def screen_many(transactions, progress=None):
+    return [
+        final_output
+        for chunk in chunked(transactions, BATCH_CHUNK_SIZE)
+        for _, final_output in screen_chunk(chunk, progress=progress)
+    ]
+
+def screen_job(request, progress):
+    """A job is either one transaction or a list of them, screened like /screen or /screen/batch."""
+    if isinstance(request, list):
+        return {"results": screen_many(request, progress)}
+    return screen_one(request, progress)
+
+@asynccontextmanager
+async def lifespan(app):
+    loop = asyncio.get_running_loop()
+    app.state.executor = ThreadPoolExecutor(max_workers=API_WORKERS, thread_name_prefix="api")
+    app.state.job_store = JobStore(sqlite_path_from_uri(config.SQLALCHEMY_DATABASE_URI))
+    app.state.jobs = JobQueue(app.state.job_store, screen_job)
+    # Load the models before the first request. With MODEL_WORKERS set they are loaded only in the
+    # worker processes, which then run every model call (map_shards), so this process stays model-free
+    if not start_model_workers():
+        await loop.run_in_executor(app.state.executor, warm_up)
+    app.state.jobs.start()
+    yield
+    app.state.jobs.stop()
+    app.state.executor.shutdown(wait=False, cancel_futures=True)
+    stop_model_workers()
+
+app = FastAPI(title="Transaction Risk Screening API", debug=config.DEBUG, lifespan=lifespan)
+
+async def run_blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(app.state.executor, fn, *args)
+
+@app.get("/health")
+async def health():
+    return {"status": "ok"}
+
+@app.post("/screen")
+async def screen(transaction: Transaction = Body(...)):
+    """Screen a single transaction (a JSON object, or the raw transaction text)."""
+    # Only malformed input is a client error; anything the pipeline raises is a 500
+    try:
+        transaction = single_transaction(transaction)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return await run_blocking(screen_one, transaction)
+
+@app.post("/screen/batch")
+async def screen_batch(transactions: List[Transaction] = Body(...)):
+    """Screen many transactions at once; lookups are shared by the entities they have in common."""
+    if len(transactions) > API_MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {API_MAX_BATCH_SIZE} transactions per batch")
+    try:
+        validate_batch(transactions)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"results": await run_blocking(screen_many, transactions)}
+
+@app.post("/jobs", status_code=202)
+async def submit_job(request: Union[Transaction, List[Transaction]] = Body(...)):
+    """Queue a screening of one transaction or a list of them; poll /jobs/{job_id} for its progress and result."""
+    if isinstance(request, list) and len(request) > API_MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"At most {API_MAX_BATCH_SIZE} transactions per job")
+    try:
+        if isinstance(request, list):
+            validate_batch(request)
+        else:
+            request = single_transaction(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        # The job store is synchronous SQLite; its calls run off the event loop, but not on the busy screening threads
+        job_id = await asyncio.to_thread(app.state.jobs.submit, request)
+    except queue.Full:
+        return JSONResponse(
+            status_code=503,
+            content={"detail": "Too many screenings queued; retry later"},
+            headers={"Retry-After": str(JOB_RETRY_AFTER)},
+        )
+    return {"job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}", "events_url": f"/jobs/{job_id}/events"}
+
+def get_job_or_404(job_id):
+    job = app.state.job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}")
+    return job
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    """Status, per-stage progress and, once done, the result of a job."""
+    job = get_job_or_404(job_id)
+    job["progress"] = [event for _, event in app.state.job_store.events_after(job_id)]
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-sent events: one "progress" event per finished stage, then a final "job" event with the result."""
+    await asyncio.to_thread(get_job_or_404, job_id)
+    store = app.state.job_store
+
+    async def events():
+        seq = 0
+        while True:
+            # Read the status first so no progress recorded before the job finished is missed
+            job = await asyncio.to_thread(store.get, job_id)
+            for seq, event in await asyncio.to_thread(store.events_after, job_id, seq):
+                yield f"id: {seq}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+            if job["status"] in FINISHED:
+                yield f"event: job\ndata: {json.dumps(job)}\n\n"
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host=os.getenv("API_HOST", "0.0.0.0"), port=int(os.getenv("API_PORT", "8000")))
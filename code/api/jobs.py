@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import uuid
+import queue
+import sqlite3
+import threading
+
+# Screenings running at once; each one already fans out to its own stage threads
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# Jobs waiting for a worker; submissions beyond this are refused until the queue drains
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+# Several API processes may share the database; each one heartbeats, and only the unfinished jobs of a
+# process that has not heartbeated for JOB_OWNER_TIMEOUT seconds are failed
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_OWNER_TIMEOUT = float(os.getenv("JOB_OWNER_TIMEOUT", "60"))
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+def sqlite_path_from_uri(uri):
+    """Turn a SQLAlchemy sqlite URI (sqlite:///relative.db, sqlite:////absolute.db, sqlite:///:memory:) into a sqlite3 path."""
+    prefix = "sqlite:///"
+    if not uri.startswith(prefix):
+        raise ValueError(f"Only sqlite databases are supported for jobs, got {uri!r}")
+    path = uri[len(prefix):]
+    if path in ("", ":memory:"):
+        # One connection per thread, so the in-memory database must be shared between them
+        return f"file:jobs-{uuid.uuid4().hex}?mode=memory&cache=shared"
+    return path
+
+class JobStore:
+    """SQLite-backed job records and their progress events.
+
+    Requests, results and events are stored as JSON. Each job records the store instance
+    (one per API process) that owns it; unfinished jobs whose owner stopped heartbeating
+    were cut off by a crash or restart and are marked failed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.instance_id = uuid.uuid4().hex
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        # Keeps a shared in-memory database alive for as long as the store exists
+        self._keepalive = self._connection()
+        with self._write_lock, self._keepalive as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, request TEXT NOT NULL,"
+                " result TEXT, error TEXT, owner TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_events ("
+                " job_id TEXT NOT NULL, seq INTEGER NOT NULL, event TEXT NOT NULL, created_at REAL NOT NULL,"
+                " PRIMARY KEY (job_id, seq))"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS job_owners (instance_id TEXT PRIMARY KEY, heartbeat_at REAL NOT NULL)")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "owner" not in columns:
+                # Jobs tables created before owners were recorded; their unfinished jobs have no owner
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        self.heartbeat()
+
+    def heartbeat(self):
+        """Mark this instance alive and fail the unfinished jobs of instances that are not."""
+        now = time.time()
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute("INSERT OR REPLACE INTO job_owners VALUES (?, ?)", (self.instance_id, now))
+            conn.execute("DELETE FROM job_owners WHERE heartbeat_at < ?", (now - JOB_OWNER_TIMEOUT,))
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ? WHERE status IN (?, ?)"
+                " AND (owner IS NULL OR owner NOT IN (SELECT instance_id FROM job_owners))",
+                (FAILED, "Interrupted: the API process running it stopped", now, QUEUED, RUNNING),
+            )
+
+    def retire(self):
+        """Stop heartbeating as an owner; other instances then fail this one's unfinished jobs."""
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute("DELETE FROM job_owners WHERE instance_id = ?", (self.instance_id,))
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            memory = self.path.startswith("file:")
+            if not memory and os.path.dirname(self.path):
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30, uri=memory, check_same_thread=False)
+            if not memory:
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def create(self, request):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, request, owner, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, QUEUED, json.dumps(request), self.instance_id, now, now),
+            )
+        return job_id
+
+    def delete(self, job_id):
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute("DELETE FROM job_events WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+
+    def set_running(self, job_id):
+        self._update(job_id, status=RUNNING)
+
+    def finish(self, job_id, result):
+        self._update(job_id, status=DONE, result=json.dumps(result))
+
+    def fail(self, job_id, error):
+        self._update(job_id, status=FAILED, error=error)
+
+    def add_event(self, job_id, event):
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute(
+                "INSERT INTO job_events (job_id, seq, event, created_at)"
+                " SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM job_events WHERE job_id = ?",
+                (job_id, json.dumps(event), time.time(), job_id),
+            )
+
+    def get(self, job_id):
+        """Return the job as a dict (without its request), or None if it does not exist."""
+        row = self._connection().execute(
+            "SELECT status, result, error, created_at, updated_at FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, result, error, created_at, updated_at = row
+        return {
+            "job_id": job_id,
+            "status": status,
+            "result": json.loads(result) if result is not None else None,
+            "error": error,
+            "created_at": created_at,
+            "updated_at": updated_at,
+        }
+
+    def get_request(self, job_id):
+        row = self._connection().execute("SELECT request FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row is not None else None
+
+    def events_after(self, job_id, seq=0):
+        """Return the (seq, event) pairs of a job recorded after `seq`, oldest first."""
+        rows = self._connection().execute(
+            "SELECT seq, event FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, seq)
+        ).fetchall()
+        return [(row_seq, json.loads(event)) for row_seq, event in rows]
+
+class JobQueue:
+    """Runs jobs from a bounded queue on a fixed pool of worker threads.
+
+    `screen(request, progress)` does the work; its return value is stored as the job result
+    and every event it passes to `progress` is recorded against the job.
+    """
+
+    def __init__(self, store, screen, workers=JOB_WORKERS, queue_size=JOB_QUEUE_SIZE):
+        self.store = store
+        self.screen = screen
+        self.workers = workers
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"job-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+        heartbeat.start()
+
+    def stop(self):
+        """Let the workers finish their current jobs and exit; jobs still queued are failed by the next instance."""
+        self._stopping.set()
+        try:
+            self.store.retire()
+        except sqlite3.Error as e:
+            print(f"Could not retire job store instance {self.store.instance_id}: {e}")
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                # Busy workers see the stop flag once their current job is done
+                break
+        self._threads = []
+
+    def submit(self, request):
+        """Record and enqueue a job; raises queue.Full, without recording it, when the queue is full."""
+        job_id = self.store.create(request)
+        try:
+            self._queue.put_nowait(job_id)
+        except queue.Full:
+            self.store.delete(job_id)
+            raise
+        return job_id
+
+    def _heartbeat(self):
+        while not self._stopping.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                self.store.heartbeat()
+            except sqlite3.Error as e:
+                # Missing a beat is harmless as long as the next ones land within JOB_OWNER_TIMEOUT
+                print(f"Job store heartbeat failed: {e}")
+
+    def _work(self):
+        while not self._stopping.is_set():
+            job_id = self._queue.get()
+            if job_id is None:
+                return
+            try:
+                self.store.set_running(job_id)
+                result = self.screen(self.store.get_request(job_id), lambda event: self.store.add_event(job_id, event))
+                self.store.finish(job_id, result)
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                try:
+                    self.store.fail(job_id, str(e))
+                except sqlite3.Error as store_error:
+                    # The worker must outlive a store that is briefly unavailable; the job is failed on the next start
+                    print(f"Could not record the failure of job {job_id}: {store_error}")
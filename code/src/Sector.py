@@ -1,8 +1,87 @@
 import requests
 import json
+import os
+import time
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from fuzzywuzzy import process
+from name_index import NameIndex
+from kv_cache import PersistentCache
 
 SEC_COMPANY_DB_URL = "https://www.sec.gov/files/company_tickers.json"
+SEC_HEADERS = {"User-Agent": "your@email.com"}  # SEC requires a valid User-Agent
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+SEC_TICKERS_PATH = os.getenv("SEC_TICKERS_PATH", os.path.join(root_dir, ".cache", "company_tickers.json"))
+SEC_TICKERS_REFRESH_INTERVAL = int(os.getenv("SEC_TICKERS_REFRESH_INTERVAL", str(24 * 60 * 60)))
+# After a failed refresh, wait this long before downloading again (the stale copy is served meanwhile)
+SEC_TICKERS_RETRY_INTERVAL = int(os.getenv("SEC_TICKERS_RETRY_INTERVAL", str(15 * 60)))
+SEC_SECTOR_CACHE_TTL = int(os.getenv("SEC_SECTOR_CACHE_TTL", str(90 * 24 * 60 * 60)))
+SEC_FETCH_WORKERS = int(os.getenv("SEC_FETCH_WORKERS", "8"))
+# SEC allows 10 requests/second per client; requests from this process are spaced to stay below it
+SEC_MAX_REQUESTS_PER_SECOND = float(os.getenv("SEC_MAX_REQUESTS_PER_SECOND", "8"))
+
+# CIK -> SIC description; a company's SIC code almost never changes
+sector_cache = PersistentCache("sec_sector", SEC_SECTOR_CACHE_TTL)
+
+_ticker_index = None
+_ticker_index_loaded_at = 0
+_tickers_refresh_attempted_at = None
+_ticker_index_lock = threading.Lock()
+_sec_next_request_at = 0.0
+_sec_rate_lock = threading.Lock()
+
+def wait_for_sec_rate_limit():
+    """Block until this process may send its next SEC request; each caller reserves its own time slot."""
+    global _sec_next_request_at
+    with _sec_rate_lock:
+        now = time.monotonic()
+        slot = max(now, _sec_next_request_at)
+        _sec_next_request_at = slot + 1 / SEC_MAX_REQUESTS_PER_SECOND
+    if slot > now:
+        time.sleep(slot - now)
+
+def refresh_company_tickers():
+    """Download company_tickers.json from the SEC and persist it locally."""
+    wait_for_sec_rate_limit()
+    response = requests.get(SEC_COMPANY_DB_URL, headers=SEC_HEADERS, timeout=30)
+    response.raise_for_status()
+    os.makedirs(os.path.dirname(SEC_TICKERS_PATH), exist_ok=True)
+    tmp_path = SEC_TICKERS_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        file.write(response.text)
+    os.replace(tmp_path, SEC_TICKERS_PATH)
+
+def _tickers_are_stale():
+    if not os.path.exists(SEC_TICKERS_PATH):
+        return True
+    return time.time() - os.path.getmtime(SEC_TICKERS_PATH) > SEC_TICKERS_REFRESH_INTERVAL
+
+def get_ticker_index():
+    """Return (companies, name index) built from the local ticker file, refreshing it when stale."""
+    global _ticker_index, _ticker_index_loaded_at, _tickers_refresh_attempted_at
+    with _ticker_index_lock:
+        retry_due = _tickers_refresh_attempted_at is None or \
+            time.monotonic() - _tickers_refresh_attempted_at > SEC_TICKERS_RETRY_INTERVAL
+        if retry_due and _tickers_are_stale():
+            # Recorded before the download, so a failing SEC endpoint is not retried (under the lock) on every lookup
+            _tickers_refresh_attempted_at = time.monotonic()
+            try:
+                refresh_company_tickers()
+            except requests.exceptions.RequestException as e:
+                # Keep serving the previous copy if there is one
+                print(f"Error refreshing SEC company tickers: {e}")
+        if not os.path.exists(SEC_TICKERS_PATH):
+            return None
+        mtime = os.path.getmtime(SEC_TICKERS_PATH)
+        if _ticker_index is None or mtime != _ticker_index_loaded_at:
+            with open(SEC_TICKERS_PATH, "r", encoding="utf-8") as file:
+                data = json.load(file)
+            companies = {c["title"]: str(c["cik_str"]).zfill(10) for c in data.values()}
+            _ticker_index = (companies, NameIndex(companies))
+            _ticker_index_loaded_at = mtime
+        return _ticker_index
 
 def get_cik_by_name(company_name):
     """
@@ -11,40 +90,38 @@ def get_cik_by_name(company_name):
     :param company_name: The name of the company to search for.
     :return: A tuple (Company Name, CIK) or None if not found.
     """
-    headers = {"User-Agent": "your@email.com"}  # SEC requires a valid User-Agent
-
     try:
-        response = requests.get(SEC_COMPANY_DB_URL, headers=headers)
-
-        if response.status_code != 200:
-            print(f"SEC API error: {response.status_code}")
+        ticker_index = get_ticker_index()
+        if ticker_index is None:
+            print("SEC company tickers are not available")
             return None
+        companies, name_index = ticker_index
 
-        data = response.json()
-        companies = {c["title"]: str(c["cik_str"]).zfill(10) for c in data.values()}
-
-        # Use fuzzy matching to get the closest company name
-        best_match, score = process.extractOne(company_name, companies.keys())
+        # Narrow down to a few candidates, then use fuzzy matching to get the closest company name
+        candidates = name_index.candidate_names(company_name)
+        if not candidates:
+            return None
+        best_match, score = process.extractOne(company_name, candidates)
 
         if score > 80:  # Only return if match confidence is high
             return best_match, companies[best_match]
         else:
             return None
 
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching data from SEC: {e}")
-        return None
     except Exception as e:
         print(f"Unexpected error: {e}")
         return None
     
 def get_sector(cik):
     cik = str(cik).zfill(10)  # Ensure CIK is 10 digits
+    cached = sector_cache.get(cik)
+    if cached is not None:
+        return cached
     url = f"https://data.sec.gov/submissions/CIK{cik}.json"
-    headers = {"User-Agent": "your@email.com"}  # SEC requires this format
 
     try:
-        response = requests.get(url, headers=headers)
+        wait_for_sec_rate_limit()
+        response = requests.get(url, headers=SEC_HEADERS, timeout=30)
 
         if response.status_code != 200:
             print(f"SEC API error: {response.status_code}")
@@ -56,6 +133,7 @@ def get_sector(cik):
         if "sicDescription" not in data:
             print("Unexpected response structure:", data.keys())
             return "Unknown"
+        sector_cache.set(cik, data["sicDescription"])
         return data["sicDescription"]
     except requests.exceptions.RequestException as e:
         print(f"Error fetching data from SEC: {e}")
@@ -63,11 +141,46 @@ def get_sector(cik):
     except Exception as e:
         print(f"Unexpected error: {e}")
         return None
+
+def prefill_sector_cache(submissions_zip_path, batch_size=10000):
+    """Load every CIK's SIC description from SEC's bulk submissions.zip into the sector cache.
+
+    The archive is published at https://www.sec.gov/Archives/edgar/daily-index/bulkdata/submissions.zip
+    """
+    count = 0
+    batch = {}
+    with zipfile.ZipFile(submissions_zip_path) as archive:
+        for entry in archive.namelist():
+            # CIK##########.json holds the company metadata; the -submissions-NNN files only hold older filings
+            if not entry.startswith("CIK") or not entry.endswith(".json") or "-" in entry:
+                continue
+            with archive.open(entry) as file:
+                data = json.load(file)
+            if data.get("sicDescription"):
+                batch[entry[3:13]] = data["sicDescription"]
+            if len(batch) >= batch_size:
+                sector_cache.set_many(batch)
+                count += len(batch)
+                batch = {}
+    if batch:
+        sector_cache.set_many(batch)
+        count += len(batch)
+    print(f"Prefilled sector cache with {count} companies")
+    return count
+
+def get_company_sector(company):
+    match = get_cik_by_name(company)
+    if match is None:
+        print(f"No SEC match for {company}")
+        return None
+    return get_sector(match[1])
+
 def getSectors(companies, entity_types):
-    obj={}
-    for company, entity_type in zip(companies, entity_types):
-        if entity_type.lower() not in ["individual", "pep"]:  # Exclude individuals and PEPs
-            ciks = get_cik_by_name(company)
-            sector = get_sector(ciks[1])
-            obj[company] = sector
-    return obj
\ No newline at end of file
+    organizations = [
+        company for company, entity_type in zip(companies, entity_types)
+        if entity_type.lower() not in ["individual", "pep"]  # Exclude individuals and PEPs
+    ]
+    # Cache misses go to the SEC concurrently
+    with ThreadPoolExecutor(max_workers=SEC_FETCH_WORKERS) as executor:
+        sectors = list(executor.map(get_company_sector, organizations))
+    return dict(zip(organizations, sectors))
@@ -0,0 +1,102 @@
+import os
+import argparse
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+
+from process_transaction import process_transactions
+from news_fetch import get_news_with_full_content
+from news_sentiment_analysis import news_sentiment_analysis_score
+from geo_risk_analysis import geo_risk_analysis
+from Sector import getSectors
+from sanctions import screen_entities
+from stage_executor import Stage, run_stages
+from model_workers import start_models
+from main import finalize_transaction, report_progress, sanction_cases_for, root_dir
+from transaction_io import ResultWriter, chunked, count_results, iter_transactions
+
+# Nightly batches are bounded by these rather than by the interactive per-transaction timeouts
+BATCH_NEWS_DEADLINE = float(os.getenv("BATCH_NEWS_DEADLINE", "600"))
+BATCH_STAGE_TIMEOUT = float(os.getenv("BATCH_STAGE_TIMEOUT", "1800"))
+# Transactions scored at once; their LLM calls share the micro-batching queue
+BATCH_VERDICT_WORKERS = int(os.getenv("BATCH_VERDICT_WORKERS", "8"))
+# Entities are deduplicated within a chunk; across chunks the persistent lookup caches take over
+BATCH_CHUNK_SIZE = int(os.getenv("BATCH_CHUNK_SIZE", "1000"))
+BATCH_RESULT_PATH = os.path.join(root_dir, "datasets", "batch_result.jsonl")
+
+def subset_screening(screening, names):
+    """Narrow an (ofac, open_sanctions) screening of many names to the given ones."""
+    ofac_response, open_sanctions_response = screening
+    if ofac_response is not None:
+        ofac_response = {**ofac_response, "cases": [case for case in ofac_response.get("cases", []) if case.get("name") in names]}
+    if open_sanctions_response is not None:
+        open_sanctions_response = {name: matches for name, matches in open_sanctions_response.items() if name in names}
+    return ofac_response, open_sanctions_response
+
+def screen_chunk(transactions, max_workers=BATCH_VERDICT_WORKERS, progress=None):
+    """Screen a chunk, running each lookup once per unique entity and fanning the results out per transaction.
+
+    Yields a (combined_result, final_output) pair per transaction, in input order.
+    """
+    # Extraction, GLEIF enrichment, classification and PEP checks are already deduplicated across the chunk
+    extraction_results = process_transactions(transactions)
+    report_progress(progress, "extraction", "done")
+
+    entity_types = {}
+    for extraction_result in extraction_results:
+        for name, entity_type in zip(extraction_result["Extracted Entity"], extraction_result["Entity Type"]):
+            entity_types.setdefault(name, entity_type)
+    entities = list(entity_types)
+    print(f"Screening {len(extraction_results)} transactions with {len(entities)} unique entities")
+
+    unique_cases = sanction_cases_for({"Extracted Entity": entities, "Entity Type": list(entity_types.values())})
+    shared = run_stages([
+        Stage("news_fetch", lambda: get_news_with_full_content(entities, deadline=BATCH_NEWS_DEADLINE), BATCH_STAGE_TIMEOUT, default={}),
+        Stage("news_scores", news_sentiment_analysis_score, BATCH_STAGE_TIMEOUT, default={}, depends_on=["news_fetch"]),
+        Stage("sectors", lambda: getSectors(entities, list(entity_types.values())), BATCH_STAGE_TIMEOUT, default={}),
+        Stage("sanctions", lambda: screen_entities(unique_cases), BATCH_STAGE_TIMEOUT, default=(None, None)),
+    ], progress=lambda stage, status: report_progress(progress, stage, status))
+
+    geo_risks = {}
+    def finalize(extraction_result):
+        names = set(extraction_result["Extracted Entity"])
+        countries = tuple(extraction_result["Countries"])
+        if countries not in geo_risks:
+            geo_risks[countries] = geo_risk_analysis(list(countries))
+        stage_results = {
+            "news_scores": {name: score for name, score in shared["news_scores"].items() if name in names},
+            "geo_risk": geo_risks[countries],
+            "sectors": {name: sector for name, sector in shared["sectors"].items() if name in names},
+            "sanctions": subset_screening(shared["sanctions"], names),
+        }
+        return finalize_transaction(extraction_result, stage_results, sanction_cases_for(extraction_result), progress)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        yield from executor.map(finalize, extraction_results)
+
+def screen_transactions(transactions, save_path=BATCH_RESULT_PATH, resume=False, chunk_size=BATCH_CHUNK_SIZE):
+    """Screen a (possibly streamed) batch chunk by chunk, appending each result to `save_path` as JSON lines.
+
+    With `resume`, as many leading transactions as `save_path` already has results for are skipped;
+    resume with the same input file.
+    """
+    done = count_results(save_path) if resume else 0
+    if done:
+        print(f"Resuming after {done} screened transactions")
+    pending = islice(transactions, done, None)
+    screened = 0
+    with ResultWriter(save_path, append=resume) as writer:
+        for chunk in chunked(pending, chunk_size):
+            for combined_result, _ in screen_chunk(chunk):
+                writer.write(combined_result)
+                screened += 1
+            print(f"Screened {screened} transactions")
+    return screened
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Screen a JSON, JSON lines or CSV file of transactions.")
+    parser.add_argument("input_path")
+    parser.add_argument("output_path", nargs="?", default=BATCH_RESULT_PATH)
+    parser.add_argument("--resume", action="store_true", help="skip as many leading transactions as the output file has results for")
+    args = parser.parse_args()
+    start_models()
+    screen_transactions(iter_transactions(args.input_path), args.output_path, resume=args.resume)
@@ -0,0 +1,21 @@
+import os
+import json
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+ARTIFACTS_DIR = os.path.join(root_dir, "artifacts", "arch")
+
+# Intermediate pipeline results are only written to disk when this is enabled
+PIPELINE_DEBUG_DUMP = os.getenv("PIPELINE_DEBUG_DUMP", "").lower() in ("1", "true", "yes")
+
+def artifact_path(file_name):
+    return os.path.join(ARTIFACTS_DIR, file_name)
+
+def debug_dump(file_name, data):
+    """Write an intermediate result to artifacts/arch when PIPELINE_DEBUG_DUMP is set."""
+    if not PIPELINE_DEBUG_DUMP:
+        return
+    save_path = artifact_path(file_name)
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
+    with open(save_path, "w", encoding="utf-8") as file:
+        json.dump(data, file, indent=4, ensure_ascii=False)
+    print(f"Debug dump saved to {save_path}")
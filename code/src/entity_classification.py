@@ -1,5 +1,9 @@
+import os
 import requests
-from transformers import pipeline
+from model_registry import get_zero_shot_classifier
+
+ENTITY_LABELS = ["Corporation", "Non-Profit", "Shell Company", "Government Agency"]
+ZERO_SHOT_BATCH_SIZE = int(os.getenv("ZERO_SHOT_BATCH_SIZE", "32"))
 
 def check_shell_company(company_name):
     """Check if the entity appears in the Offshore Leaks Database."""
@@ -31,21 +35,37 @@ def check_shell_company(company_name):
     except requests.RequestException:
         return False, None
 
+def classify_entities(entity_names, batch_size=ZERO_SHOT_BATCH_SIZE):
+    """Classify many entities at once.
+
+    Every (entity, label) hypothesis pair of the entities not found in the
+    Offshore Leaks Database goes through the NLI model in padded batches.
+    """
+    classifications = {}
+    pending = []
+    for entity_name in entity_names:
+        is_shell, evidence = check_shell_company(entity_name)
+        if is_shell:
+            classifications[entity_name] = {'sequence': entity_name, 'label': 'Shell Company', 'score': 0.95, 'supporting_evidence': evidence}
+        else:
+            pending.append(entity_name)
+
+    if pending:
+        classifier = get_zero_shot_classifier()
+        results = classifier(pending, candidate_labels=ENTITY_LABELS, batch_size=batch_size)
+        if isinstance(results, dict):
+            results = [results]
+        for entity_name, result in zip(pending, results):
+            max_score_index = result['scores'].index(max(result['scores']))
+            classifications[entity_name] = {
+                'sequence': entity_name,
+                'label': result['labels'][max_score_index],
+                'score': result['scores'][max_score_index],
+                'supporting_evidence': None
+            }
+
+    return [classifications[entity_name] for entity_name in entity_names]
+
 def classify_entity(entity_name):
     """Classify an entity using NLP and databases."""
-    labels = ["Corporation", "Non-Profit", "Shell Company", "Government Agency"]
-    
-    is_shell, evidence = check_shell_company(entity_name)
-    if is_shell:
-        return {'sequence': entity_name, 'label': 'Shell Company', 'score': 0.95, 'supporting_evidence': evidence}
-    
-    classifier = pipeline("zero-shot-classification", model="FacebookAI/roberta-large-mnli")
-    result = classifier(entity_name, candidate_labels=labels)
-    max_score_index = result['scores'].index(max(result['scores']))
-    
-    return {
-        'sequence': entity_name,
-        'label': result['labels'][max_score_index],
-        'score': result['scores'][max_score_index],
-        'supporting_evidence': None
-    }
\ No newline at end of file
+    return classify_entities([entity_name])[0]
@@ -1,24 +1,186 @@
+import os
+import csv
+import sqlite3
+import threading
 import requests
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from kv_cache import PersistentCache
+from name_index import NORMALIZATION_VERSION, normalize_name
 
 GLEIF_API = "https://api.gleif.org/api/v1"
+GLEIF_REQUEST_TIMEOUT = float(os.getenv("GLEIF_REQUEST_TIMEOUT", "10"))
+GLEIF_CACHE_TTL = int(os.getenv("GLEIF_CACHE_TTL", str(7 * 24 * 60 * 60)))
+GLEIF_FETCH_WORKERS = int(os.getenv("GLEIF_FETCH_WORKERS", "8"))
 
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+ISO3166_PATH = os.path.join(root_dir, "datasets", "iso3166.csv")
+# Local store built from a GLEIF Golden Copy file by load_gleif_golden_copy; used instead of the API when present
+GLEIF_GOLDEN_COPY_DB = os.getenv("GLEIF_GOLDEN_COPY_DB", os.path.join(root_dir, ".cache", "gleif_golden_copy.sqlite"))
+
+_session = requests.Session()
+_session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=16))
+
+gleif_cache = PersistentCache("gleif", GLEIF_CACHE_TTL)
+
+# **ISO 3166 country table (bundled, loaded once)**
+def load_iso3166_countries():
+    with open(ISO3166_PATH, "r", encoding="utf-8", newline="") as file:
+        return {row["Code"]: row["Country"] for row in csv.DictReader(file)}
+
+ISO3166_COUNTRIES = load_iso3166_countries()
+
+def map_iso3166_country(country_code):
+    """Map an ISO 3166 alpha-2 code to its country, in the shape the GLEIF countries API returned."""
+    name = ISO3166_COUNTRIES.get((country_code or "").upper())
+    if name is None:
+        return {}
+    return {"type": "countries", "id": country_code.upper(), "attributes": {"code": country_code.upper(), "name": name}}
+
+# **GLEIF Golden Copy (offline mode)**
+def load_gleif_golden_copy(csv_path, db_path=GLEIF_GOLDEN_COPY_DB, batch_size=50000):
+    """Build the local legal-name -> LEI/country store from a GLEIF Golden Copy LEI CSV file."""
+    os.makedirs(os.path.dirname(db_path), exist_ok=True)
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path)
+    # Lets a store built under an older normalize_name be detected, and names the file to rebuild it from
+    conn.execute("CREATE TABLE store_meta (key TEXT PRIMARY KEY, value TEXT)")
+    conn.executemany(
+        "INSERT INTO store_meta VALUES (?, ?)",
+        [("normalization_version", str(NORMALIZATION_VERSION)), ("source_path", os.path.abspath(csv_path))],
+    )
+    conn.execute("CREATE TABLE lei_records (lei TEXT PRIMARY KEY, legal_name TEXT, normalized_name TEXT, country TEXT)")
+    conn.execute("CREATE VIRTUAL TABLE lei_names USING fts5(normalized_name, content='lei_records', content_rowid='rowid')")
+
+    count = 0
+    rows = []
+    with open(csv_path, "r", encoding="utf-8", newline="") as file:
+        for record in csv.DictReader(file):
+            legal_name = record.get("Entity.LegalName", "")
+            rows.append((record["LEI"], legal_name, normalize_name(legal_name), record.get("Entity.LegalAddress.Country", "")))
+            if len(rows) >= batch_size:
+                conn.executemany("INSERT OR REPLACE INTO lei_records VALUES (?, ?, ?, ?)", rows)
+                count += len(rows)
+                rows = []
+    if rows:
+        conn.executemany("INSERT OR REPLACE INTO lei_records VALUES (?, ?, ?, ?)", rows)
+        count += len(rows)
+
+    conn.execute("CREATE INDEX lei_records_name ON lei_records (normalized_name)")
+    conn.execute("INSERT INTO lei_names (lei_names) VALUES ('rebuild')")
+    conn.commit()
+    conn.close()
+    os.replace(tmp_path, db_path)
+    print(f"Loaded {count} LEI records into {db_path}")
+    return count
+
+_golden_copy = threading.local()
+_golden_copy_checked_mtime = None
+_golden_copy_usable = False
+_golden_copy_check_lock = threading.Lock()
+
+def _read_store_meta(db_path):
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        return dict(conn.execute("SELECT key, value FROM store_meta").fetchall())
+    except sqlite3.OperationalError:
+        # Stores built before store_meta existed used normalization version 1
+        return {"normalization_version": "1"}
+    finally:
+        conn.close()
+
+def _golden_copy_is_current():
+    """Check (once per store file) that the store was built with the current normalize_name.
+
+    An outdated store is not rebuilt here, on the lookup path (a Golden Copy has millions of rows);
+    lookups use the GLEIF API until load_gleif_golden_copy is run again.
+    """
+    global _golden_copy_checked_mtime, _golden_copy_usable
+    with _golden_copy_check_lock:
+        mtime = os.path.getmtime(GLEIF_GOLDEN_COPY_DB)
+        if mtime == _golden_copy_checked_mtime:
+            return _golden_copy_usable
+        meta = _read_store_meta(GLEIF_GOLDEN_COPY_DB)
+        _golden_copy_usable = meta.get("normalization_version") == str(NORMALIZATION_VERSION)
+        if not _golden_copy_usable:
+            source = meta.get("source_path", "the Golden Copy CSV")
+            print(f"GLEIF store {GLEIF_GOLDEN_COPY_DB} uses an older name normalization; using the GLEIF API "
+                  f"until it is rebuilt with load_gleif_golden_copy({source!r})")
+        _golden_copy_checked_mtime = mtime
+        return _golden_copy_usable
+
+def _golden_copy_connection():
+    if not os.path.exists(GLEIF_GOLDEN_COPY_DB) or not _golden_copy_is_current():
+        return None
+    conn = getattr(_golden_copy, "conn", None)
+    # A connection opened before the store was replaced still reads the old file
+    if conn is None or getattr(_golden_copy, "mtime", None) != _golden_copy_checked_mtime:
+        if conn is not None:
+            conn.close()
+        conn = sqlite3.connect(f"file:{GLEIF_GOLDEN_COPY_DB}?mode=ro", uri=True)
+        _golden_copy.conn = conn
+        _golden_copy.mtime = _golden_copy_checked_mtime
+    return conn
+
+def _golden_copy_record(lei, legal_name, country):
+    return {
+        "type": "lei-records",
+        "id": lei,
+        "attributes": {
+            "lei": lei,
+            "entity": {"legalName": {"name": legal_name}, "legalAddress": {"country": country}}
+        }
+    }
+
+def _query_golden_copy(conn, entity_name):
+    normalized = normalize_name(entity_name)
+    if not normalized:
+        return {}
+    row = conn.execute(
+        "SELECT lei, legal_name, country FROM lei_records WHERE normalized_name = ? LIMIT 1", (normalized,)
+    ).fetchone()
+    if row is None:
+        # Fall back to the best full-text hit containing the whole name as a phrase
+        phrase = '"' + normalized.replace('"', "") + '"'
+        row = conn.execute(
+            "SELECT r.lei, r.legal_name, r.country FROM lei_names"
+            " JOIN lei_records r ON r.rowid = lei_names.rowid"
+            " WHERE lei_names MATCH ? ORDER BY bm25(lei_names) LIMIT 1",
+            (phrase,),
+        ).fetchone()
+    return _golden_copy_record(*row) if row else {}
+
+# **GLEIF lookups**
 def query_gleif(entity_name):
     """Fetches entity details from the GLEIF database."""
+    conn = _golden_copy_connection()
+    if conn is not None:
+        return _query_golden_copy(conn, entity_name)
+
+    cached = gleif_cache.get(entity_name)
+    if cached is not None:
+        return cached
     params = {"filter[entity.legalName]": entity_name}
     url = f"{GLEIF_API}/lei-records"
-    response = requests.get(url, params=params)
-    
+    try:
+        response = _session.get(url, params=params, timeout=GLEIF_REQUEST_TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        print(f"Error querying GLEIF for {entity_name}: {e}")
+        return {}
+
     if response.status_code == 200:
         gleif_data = response.json().get("data", [])
-        return gleif_data[0] if gleif_data else {}
+        record = gleif_data[0] if gleif_data else {}
+        gleif_cache.set(entity_name, record)
+        return record
     return {}
 
-def map_iso3166_country(country_code):
-    """Fetch country name from ISO 3166 using GLEIF API."""
-    url = f"{GLEIF_API}/countries/{country_code}"
-    response = requests.get(url)
-
-    if response.status_code == 200:
-        gleif_data = response.json().get("data", [])
-        return gleif_data if gleif_data else {}
-    return {}
\ No newline at end of file
+def query_gleif_batch(entity_names):
+    """Look up many legal names at once; returns a dict of name -> GLEIF record ({} when unknown)."""
+    entity_names = list(dict.fromkeys(entity_names))
+    if _golden_copy_connection() is not None or len(entity_names) <= 1:
+        return {entity_name: query_gleif(entity_name) for entity_name in entity_names}
+    with ThreadPoolExecutor(max_workers=GLEIF_FETCH_WORKERS) as executor:
+        return dict(zip(entity_names, executor.map(query_gleif, entity_names)))
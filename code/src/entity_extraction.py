@@ -1,3 +1,8 @@
+import os
+from model_registry import get_ner_pipeline
+
+NER_BATCH_SIZE = int(os.getenv("NER_BATCH_SIZE", "16"))
+
 def merge_entities(entities):
     """Merge and clean NER results."""
     merged = []
@@ -12,4 +17,18 @@ def merge_entities(entities):
         merged_entity = word.replace(" - ", "-")
         if len(merged_entity.split()) > 1 or len(merged_entity) > 6:
             merged.append((merged_entity, tag))
-    return merged
\ No newline at end of file
+    return merged
+
+def run_ner_batch(texts, batch_size=NER_BATCH_SIZE):
+    """Run NER over many strings in padded batches.
+
+    Returns a dict mapping each distinct non-empty text to its raw NER result.
+    """
+    unique_texts = list(dict.fromkeys(text for text in texts if text and text.strip()))
+    if not unique_texts:
+        return {}
+    # Similar lengths in the same batch keep padding low
+    unique_texts.sort(key=len)
+    ner = get_ner_pipeline()
+    results = ner(unique_texts, batch_size=batch_size)
+    return dict(zip(unique_texts, results))
@@ -1,4 +1,5 @@
 import pandas as pd
+import numpy as np
 import os
 
 DEFAULT_CPI = 50    
@@ -71,21 +72,60 @@ def calculate_transaction_risk(country1, country2, cpi_scores, aml_scores, gti_s
     return round(transaction_risk, 2)
 
 
-def geo_risk_analysis(countries):
-
+# **Country Risk Tables (built once at import)**
+# One row per known country plus a trailing row of defaults for unknown countries.
+def build_country_risk_table():
     cpi_scores, latest_year = load_cpi_data()
     aml_scores = load_aml_data()
     gti_scores = load_gti_data()
     fatf_list = load_fatf_data()
 
-    total_risk = 0
-    risk_details = []
+    countries = sorted(set(cpi_scores) | set(aml_scores) | set(gti_scores) | set(fatf_list))
+    table = np.array(
+        [[cpi_scores.get(c, DEFAULT_CPI), aml_scores.get(c, DEFAULT_AML), gti_scores.get(c, DEFAULT_GTI),
+          FATF_BLACK_PENALTY if fatf_list.get(c) == "Black" else FATF_GREY_PENALTY if fatf_list.get(c) == "Grey" else 0]
+         for c in countries] + [[DEFAULT_CPI, DEFAULT_AML, DEFAULT_GTI, 0]],
+        dtype=float,
+    )
+    return {country: i for i, country in enumerate(countries)}, table
+
+def build_geo_risk_matrix(table):
+    """Risk of every country pair, same arithmetic as calculate_transaction_risk."""
+    cpi_risk, aml, gti, fatf_penalty = 100 - table[:, 0], table[:, 1], table[:, 2], table[:, 3]
+    avg_cpi_risk = (cpi_risk[:, None] + cpi_risk[None, :]) / 2
+    avg_aml_risk = (aml[:, None] + aml[None, :]) / 2
+    avg_gti_risk = (gti[:, None] + gti[None, :]) / 2
+    transaction_risk = (0.4 * avg_cpi_risk) + (0.3 * avg_aml_risk) + (0.3 * avg_gti_risk)
+    transaction_risk += fatf_penalty[:, None] + fatf_penalty[None, :]
+    # Python's round, not np.round, so half-way values match the scalar path exactly
+    return np.array([round(value, 2) for value in transaction_risk.ravel().tolist()]).reshape(transaction_risk.shape)
+
+COUNTRY_INDEX, COUNTRY_TABLE = build_country_risk_table()
+UNKNOWN_COUNTRY_INDEX = len(COUNTRY_INDEX)
+GEO_RISK_MATRIX = build_geo_risk_matrix(COUNTRY_TABLE)
+
+def country_indices(countries):
+    return np.array([COUNTRY_INDEX.get(c, UNKNOWN_COUNTRY_INDEX) for c in countries], dtype=np.intp)
+
+def geo_risk_matrix(countries_a, countries_b, outer=False):
+    """Score many corridors at once.
+
+    By default scores each corridor countries_a[i] ↔ countries_b[i] and returns a 1-D array;
+    with outer=True returns the len(countries_a) x len(countries_b) matrix of every pair.
+    """
+    index_a, index_b = country_indices(countries_a), country_indices(countries_b)
+    if outer:
+        return GEO_RISK_MATRIX[np.ix_(index_a, index_b)]
+    return GEO_RISK_MATRIX[index_a, index_b]
+
+def geo_risk_analysis(countries):
+    corridor_risks = geo_risk_matrix(countries[:-1], countries[1:]) if len(countries) > 1 else np.array([])
 
-    for i in range(len(countries) - 1):
-        country1, country2 = countries[i], countries[i + 1]
-        risk_score = calculate_transaction_risk(country1, country2, cpi_scores, aml_scores, gti_scores, fatf_list)
-        total_risk += risk_score
-        risk_details.append(f"{country1} ↔ {country2}: {risk_score/100}")
+    risk_details = [
+        f"{country1} ↔ {country2}: {float(risk_score)/100}"
+        for country1, country2, risk_score in zip(countries[:-1], countries[1:], corridor_risks)
+    ]
+    total_risk = float(corridor_risks.sum())
 
     max_possible_score = (len(countries) - 1) * 100  
     normalized_score = (total_risk / max_possible_score) * 100  
@@ -0,0 +1,137 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+CACHE_DB_PATH = os.getenv("CACHE_DB_PATH", os.path.join(root_dir, ".cache", "riskunlocked.sqlite"))
+# Keys per SELECT in get_many; older SQLite builds allow at most 999 bound parameters
+GET_MANY_CHUNK_SIZE = 500
+
+class PersistentCache:
+    """SQLite-backed key/value cache with per-entry TTL and size-based eviction.
+
+    Values are stored as JSON. Several caches can share one database file,
+    each under its own namespace. When a namespace grows past `max_bytes`
+    the least recently used entries are evicted. A ttl of 0 or None never expires.
+    """
+
+    def __init__(self, namespace, ttl, max_bytes=None, path=CACHE_DB_PATH):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        with self._connection() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL, expires_at REAL, accessed_at REAL NOT NULL,"
+                " PRIMARY KEY (namespace, key))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_lru ON cache (namespace, accessed_at)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, key),
+        ).fetchone()
+        if row is None:
+            return default
+        value, expires_at = row
+        now = time.time()
+        if expires_at is not None and expires_at < now:
+            self.delete(key)
+            return default
+        with self._write_lock, conn:
+            conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key),
+            )
+        return json.loads(value)
+
+    def get_many(self, keys):
+        """Return a dict of the keys that are cached and not expired, with one read and one write transaction."""
+        keys = list(dict.fromkeys(keys))
+        conn = self._connection()
+        rows = []
+        for start in range(0, len(keys), GET_MANY_CHUNK_SIZE):
+            chunk = keys[start:start + GET_MANY_CHUNK_SIZE]
+            rows.extend(conn.execute(
+                f"SELECT key, value, expires_at FROM cache WHERE namespace = ? AND key IN ({', '.join('?' * len(chunk))})",
+                (self.namespace, *chunk),
+            ))
+        if not rows:
+            return {}
+        now = time.time()
+        found, hits, expired = {}, [], []
+        for key, value, expires_at in rows:
+            if expires_at is not None and expires_at < now:
+                expired.append((self.namespace, key))
+                continue
+            hits.append((now, self.namespace, key))
+            value = json.loads(value)
+            if value is not None:
+                found[key] = value
+        with self._write_lock, conn:
+            conn.executemany("UPDATE cache SET accessed_at = ? WHERE namespace = ? AND key = ?", hits)
+            conn.executemany("DELETE FROM cache WHERE namespace = ? AND key = ?", expired)
+        return found
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    def set_many(self, items, ttl=None):
+        """Store many entries in a single transaction."""
+        ttl = self.ttl if ttl is None else ttl
+        now = time.time()
+        expires_at = now + ttl if ttl else None
+        rows = []
+        for key, value in items.items():
+            payload = json.dumps(value, ensure_ascii=False)
+            rows.append((self.namespace, key, payload, len(payload), expires_at, now))
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO cache (namespace, key, value, size, expires_at, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            if self.max_bytes:
+                self._evict(conn)
+
+    def delete(self, key):
+        conn = self._connection()
+        with self._write_lock, conn:
+            conn.execute("DELETE FROM cache WHERE namespace = ? AND key = ?", (self.namespace, key))
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM cache WHERE namespace = ? AND expires_at < ?", (self.namespace, time.time()))
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache WHERE namespace = ?", (self.namespace,)).fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        rows = conn.execute(
+            "SELECT key, size FROM cache WHERE namespace = ? ORDER BY accessed_at",
+            (self.namespace,),
+        )
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((self.namespace, key))
+            total -= size
+        conn.executemany("DELETE FROM cache WHERE namespace = ? AND key = ?", stale)
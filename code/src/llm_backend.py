@@ -0,0 +1,277 @@
+import os
+import json
+import time
+import queue
+import threading
+import requests
+from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from model_registry import get_model, get_text_generator
+
+load_dotenv()
+HF_API_KEY = os.getenv("HUGGING_FACE_API_KEY")
+HF_API_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.1"
+
+# "huggingface" (remote Inference API), "ollama" (local Ollama server) or "transformers" (in-process model)
+LLM_BACKEND = os.getenv("LLM_BACKEND", "huggingface").lower()
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "mistral")
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE", "0.5"))
+LLM_MAX_NEW_TOKENS = int(os.getenv("LLM_MAX_NEW_TOKENS", "1024"))
+LLM_REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT", "120"))
+# Micro-batching: prompts queued within LLM_BATCH_WAIT_MS of each other are sent together, up to
+# LLM_BATCH_SIZE prompts and LLM_BATCH_TOKEN_BUDGET prompt + generated tokens per batch
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "8"))
+LLM_BATCH_WAIT_MS = float(os.getenv("LLM_BATCH_WAIT_MS", "20"))
+LLM_BATCH_TOKEN_BUDGET = int(os.getenv("LLM_BATCH_TOKEN_BUDGET", "32768"))
+LLM_MAX_CONCURRENT_BATCHES = int(os.getenv("LLM_MAX_CONCURRENT_BATCHES", "4"))
+
+def estimate_tokens(text):
+    """Rough token count (~4 characters per token), used when no tokenizer can be loaded."""
+    return len(text) // 4 + 1
+
+# === Prompt tokenizer ===
+_tokenizer = None
+_tokenizer_lock = threading.Lock()
+
+def get_prompt_tokenizer():
+    """Tokenizer of the backend's model, or None when it cannot be loaded (token counts are then estimated)."""
+    global _tokenizer
+    if _tokenizer is None:
+        with _tokenizer_lock:
+            if _tokenizer is None:
+                try:
+                    _tokenizer = get_text_generator().tokenizer if LLM_BACKEND == "transformers" else get_model("prompt-tokenizer")
+                except (OSError, ValueError) as e:
+                    print(f"Could not load the prompt tokenizer, estimating token counts instead: {e}")
+                    _tokenizer = False
+    return _tokenizer or None
+
+def count_tokens(text):
+    tokenizer = get_prompt_tokenizer()
+    if tokenizer is None:
+        return estimate_tokens(text)
+    return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut `text` to at most `max_tokens` tokens, marking the cut."""
+    tokenizer = get_prompt_tokenizer()
+    if tokenizer is None:
+        return text if len(text) <= max_tokens * 4 else text[:max_tokens * 4] + " ...[truncated]"
+    input_ids = tokenizer(text, add_special_tokens=False)["input_ids"]
+    if len(input_ids) <= max_tokens:
+        return text
+    return tokenizer.decode(input_ids[:max_tokens]) + " ...[truncated]"
+
+# === Backends ===
+class GenerationBackend(ABC):
+    """Generates completions for a batch of prompts; `stream` yields the text of one prompt as it is produced."""
+
+    @abstractmethod
+    def generate_batch(self, prompts, max_new_tokens, temperature):
+        """Return the completion of each prompt, in order."""
+
+    def stream(self, prompt, max_new_tokens, temperature):
+        yield from self.generate_batch([prompt], max_new_tokens, temperature)
+
+class HuggingFaceInferenceBackend(GenerationBackend):
+    """Remote HF Inference API; the prompts of a batch are sent as concurrent requests on pooled connections."""
+
+    def __init__(self, url=HF_API_URL, api_key=HF_API_KEY, timeout=LLM_REQUEST_TIMEOUT):
+        self.url = url
+        self.headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=LLM_BATCH_SIZE * LLM_MAX_CONCURRENT_BATCHES))
+        self.executor = ThreadPoolExecutor(max_workers=LLM_BATCH_SIZE * LLM_MAX_CONCURRENT_BATCHES)
+
+    def _payload(self, prompt, max_new_tokens, temperature, stream=False):
+        return {
+            "inputs": prompt,
+            "parameters": {"max_new_tokens": max_new_tokens, "temperature": temperature, "return_full_text": False},
+            "options": {"wait_for_model": True},
+            "stream": stream,
+        }
+
+    def _generate(self, prompt, max_new_tokens, temperature):
+        response = self.session.post(
+            self.url, headers=self.headers, json=self._payload(prompt, max_new_tokens, temperature), timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()[0]["generated_text"]
+
+    def generate_batch(self, prompts, max_new_tokens, temperature):
+        return list(self.executor.map(lambda prompt: self._generate(prompt, max_new_tokens, temperature), prompts))
+
+    def stream(self, prompt, max_new_tokens, temperature):
+        with self.session.post(
+            self.url, headers=self.headers, json=self._payload(prompt, max_new_tokens, temperature, stream=True),
+            timeout=self.timeout, stream=True,
+        ) as response:
+            response.raise_for_status()
+            # Server-sent events, one generated token per "data:" line
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                token = json.loads(line[len("data:"):]).get("token", {})
+                if not token.get("special"):
+                    yield token.get("text", "")
+
+class OllamaBackend(GenerationBackend):
+    """Local Ollama server (the client the UI chatbot uses); it batches concurrent requests itself (OLLAMA_NUM_PARALLEL)."""
+
+    def __init__(self, model=OLLAMA_MODEL, timeout=LLM_REQUEST_TIMEOUT):
+        import ollama
+        self.model = model
+        self.client = ollama.Client(timeout=timeout)
+        self.executor = ThreadPoolExecutor(max_workers=LLM_BATCH_SIZE * LLM_MAX_CONCURRENT_BATCHES)
+
+    def _options(self, max_new_tokens, temperature):
+        return {"num_predict": max_new_tokens, "temperature": temperature}
+
+    def _generate(self, prompt, max_new_tokens, temperature):
+        return self.client.generate(model=self.model, prompt=prompt, options=self._options(max_new_tokens, temperature))["response"]
+
+    def generate_batch(self, prompts, max_new_tokens, temperature):
+        return list(self.executor.map(lambda prompt: self._generate(prompt, max_new_tokens, temperature), prompts))
+
+    def stream(self, prompt, max_new_tokens, temperature):
+        for chunk in self.client.generate(
+            model=self.model, prompt=prompt, options=self._options(max_new_tokens, temperature), stream=True
+        ):
+            yield chunk["response"]
+
+class TransformersBackend(GenerationBackend):
+    """In-process stand-in (LOCAL_LLM_MODEL); a batch is one padded generate call."""
+
+    def __init__(self):
+        self.generator = get_text_generator()
+
+    def _generation_kwargs(self, max_new_tokens, temperature):
+        return {"max_new_tokens": max_new_tokens, "do_sample": temperature > 0, "temperature": temperature or None}
+
+    def generate_batch(self, prompts, max_new_tokens, temperature):
+        outputs = self.generator(
+            prompts, batch_size=len(prompts), return_full_text=False, **self._generation_kwargs(max_new_tokens, temperature)
+        )
+        return [output[0]["generated_text"] for output in outputs]
+
+    def stream(self, prompt, max_new_tokens, temperature):
+        from transformers import TextIteratorStreamer
+        tokenizer, model = self.generator.tokenizer, self.generator.model
+        streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=LLM_REQUEST_TIMEOUT)
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+        threading.Thread(
+            target=model.generate,
+            kwargs={**inputs, "streamer": streamer, **self._generation_kwargs(max_new_tokens, temperature)},
+            daemon=True,
+        ).start()
+        yield from streamer
+
+BACKENDS = {
+    "huggingface": HuggingFaceInferenceBackend,
+    "ollama": OllamaBackend,
+    "transformers": TransformersBackend,
+}
+
+# === Micro-batching queue ===
+class _Request:
+    def __init__(self, prompt, max_new_tokens, temperature):
+        self.prompt = prompt
+        self.max_new_tokens = max_new_tokens
+        self.temperature = temperature
+        self.tokens = count_tokens(prompt) + max_new_tokens
+        self.future = Future()
+
+class BatchingGenerator:
+    """Queues prompts from concurrent callers and dispatches them to the backend in micro-batches.
+
+    A dispatcher thread takes the first waiting prompt, then keeps adding prompts with the
+    same generation settings for up to `wait_ms` while the batch stays within `max_batch_size`
+    prompts and `token_budget` tokens. Up to `max_concurrent_batches` batches run at once.
+    """
+
+    def __init__(self, backend, max_batch_size=LLM_BATCH_SIZE, wait_ms=LLM_BATCH_WAIT_MS,
+                 token_budget=LLM_BATCH_TOKEN_BUDGET, max_concurrent_batches=LLM_MAX_CONCURRENT_BATCHES):
+        self.backend = backend
+        self.max_batch_size = max_batch_size
+        self.wait = wait_ms / 1000
+        self.token_budget = token_budget
+        self.requests = queue.Queue()
+        self.pending = None
+        self.slots = threading.BoundedSemaphore(max_concurrent_batches)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrent_batches)
+        threading.Thread(target=self._dispatch_loop, daemon=True).start()
+
+    def submit(self, prompt, max_new_tokens=LLM_MAX_NEW_TOKENS, temperature=LLM_TEMPERATURE):
+        request = _Request(prompt, max_new_tokens, temperature)
+        self.requests.put(request)
+        return request.future
+
+    def _next_batch(self):
+        first = self.pending or self.requests.get()
+        self.pending = None
+        batch, tokens = [first], first.tokens
+        deadline = time.monotonic() + self.wait
+        while len(batch) < self.max_batch_size:
+            try:
+                request = self.requests.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            same_settings = (request.max_new_tokens, request.temperature) == (first.max_new_tokens, first.temperature)
+            if not same_settings or tokens + request.tokens > self.token_budget:
+                # Starts the next batch instead
+                self.pending = request
+                break
+            batch.append(request)
+            tokens += request.tokens
+        return batch
+
+    def _dispatch_loop(self):
+        while True:
+            batch = self._next_batch()
+            self.slots.acquire()
+            self.executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        try:
+            batch = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if not batch:
+                return
+            outputs = self.backend.generate_batch(
+                [request.prompt for request in batch], batch[0].max_new_tokens, batch[0].temperature
+            )
+            for request, output in zip(batch, outputs):
+                request.future.set_result(output)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        finally:
+            self.slots.release()
+
+_generator = None
+_generator_lock = threading.Lock()
+
+def get_generator():
+    """Return the process-wide batching generator for LLM_BACKEND."""
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = BatchingGenerator(BACKENDS[LLM_BACKEND]())
+    return _generator
+
+def generate(prompt, max_new_tokens=LLM_MAX_NEW_TOKENS, temperature=LLM_TEMPERATURE, timeout=LLM_REQUEST_TIMEOUT):
+    """Generate a completion through the shared micro-batching queue; raises TimeoutError after `timeout` seconds."""
+    future = get_generator().submit(prompt, max_new_tokens, temperature)
+    try:
+        return future.result(timeout=timeout)
+    except TimeoutError:
+        future.cancel()
+        raise
+
+def stream_generate(prompt, max_new_tokens=LLM_MAX_NEW_TOKENS, temperature=LLM_TEMPERATURE):
+    """Yield the completion of one prompt as it is generated (not batched)."""
+    yield from get_generator().backend.stream(prompt, max_new_tokens, temperature)
@@ -2,64 +2,29 @@ import os
 import json
 import re
 
-from process_transaction import process_transaction
+from process_transaction import process_transactions
 from news_fetch import get_news_with_full_content
 from news_sentiment_analysis import news_sentiment_analysis_score
 from geo_risk_analysis import geo_risk_analysis
-from sector import getSectors
-from sanctions import getSanctionReports
-from verdict import verdict
+from Sector import getSectors
+from sanctions import getSanctionReports, screen_entities, sanctions_hits
+from verdict import verdict, rule_based_verdict, needs_llm_review
+from model_workers import start_models
+from stage_executor import Stage, run_stages
+from transaction_io import ResultWriter, chunked, iter_transactions_from_text
 
-def convert_text_to_transactions(input_text):
-    try:
-        data = json.loads(input_text)
-        if isinstance(data, dict):
-            return [data]
-        elif isinstance(data, list):
-            return data
-        else:
-            raise ValueError("Unexpected JSON structure.")
-    except json.JSONDecodeError:
-        try:
-            data = json.loads("[" + input_text + "]")
-            return data
-        except json.JSONDecodeError as e:
-            raise ValueError("Input text is not valid JSON or JSON-like transactions.") from e
-
-def app(transactions):
-  final_outputs = []
-  combined_results = []
-  transactions = convert_text_to_transactions(transactions)
-  for transaction in transactions:
-    # Extraction, Enrichment, Classification
-    extraction_result = process_transaction(transaction)
-    print(extraction_result)
-
-    # News Analysis and Scoring
-    news_data = get_news_with_full_content(extraction_result["Extracted Entity"])
-    news_sentiment_analysis_score()
-    root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__)))
-    scores_file = os.path.join(root_dir,"../../" "artifacts", "arch", "transaction_risk_scores.json")
-    with open(scores_file, "r", encoding="utf-8") as f:
-        scores = json.load(f)
-    extraction_result["Real Time News Analysis of Entities Involved in the transaction"] = scores
-
-    # Geo Risk Analysis and Scoring
-    geo_risk = geo_risk_analysis(extraction_result["Countries"])
-    extraction_result["Geo Risk Analysis Results of Entities Involved"] = geo_risk   
-    extraction_result["Sectors associated with Extracted Entities"] = getSectors(extraction_result["Extracted Entity"], extraction_result["Entity Type"])
-    sanction_cases = []
-    for name, ent_type in zip(extraction_result["Extracted Entity"], extraction_result["Entity Type"]):
-        if ent_type.lower() in ["individual", "pep"]:
-            type_value = "person"
-        else:
-            type_value = "organization"
-        sanction_cases.append({"name": name, "type": type_value})
-    
-    # Sanction Analysis
-    extraction_result["Sanction Analysis"] = getSanctionReports(sanction_cases)
-    implementation_details = {
+# Per-stage time limits (seconds); a stage that fails or runs over contributes an empty result
+NEWS_STAGE_TIMEOUT = float(os.getenv("NEWS_STAGE_TIMEOUT", "90"))
+GEO_STAGE_TIMEOUT = float(os.getenv("GEO_STAGE_TIMEOUT", "10"))
+SECTOR_STAGE_TIMEOUT = float(os.getenv("SECTOR_STAGE_TIMEOUT", "30"))
+SANCTIONS_STAGE_TIMEOUT = float(os.getenv("SANCTIONS_STAGE_TIMEOUT", "30"))
+
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+RESULT_PATH = os.path.join(root_dir, "datasets", "result.jsonl")
+# Transactions extracted together; bounds memory on large inputs
+APP_CHUNK_SIZE = int(os.getenv("APP_CHUNK_SIZE", "64"))
 
+IMPLEMENTATION_DETAILS = {
 "implementation_details": {
     "technology_stack": {
       "backend": "Python (FastAPI) for API development",
@@ -109,18 +74,73 @@ def app(transactions):
       }
     }
   }
-    } 
+}
+
+def convert_text_to_transactions(input_text):
+    """Parse a JSON object, JSON array, JSON lines or comma-separated objects into transactions.
 
-    verdict_response = verdict(extraction_result)
+    Transactions are objects or free-text strings (which extraction parses itself).
+    """
+    try:
+        transactions = list(iter_transactions_from_text(input_text))
+    except json.JSONDecodeError as e:
+        raise ValueError("Input text is not valid JSON or JSON-like transactions.") from e
+    if not transactions:
+        raise ValueError("Input text contains no transactions.")
+    if not all(isinstance(transaction, (dict, str)) for transaction in transactions):
+        raise ValueError("Unexpected JSON structure.")
+    return transactions
+
+def sanction_cases_for(extraction_result):
+    sanction_cases = []
+    for name, ent_type in zip(extraction_result["Extracted Entity"], extraction_result["Entity Type"]):
+        if ent_type.lower() in ["individual", "pep"]:
+            type_value = "person"
+        else:
+            type_value = "organization"
+        sanction_cases.append({"name": name, "type": type_value})
+    return sanction_cases
+
+def report_progress(progress, stage, status, transaction_id=None):
+    """Send a {"transaction", "stage", "status"} event to an optional progress callback."""
+    if progress is not None:
+        progress({"transaction": transaction_id, "stage": stage, "status": status})
+
+def run_analysis_stages(extraction_result, sanction_cases, progress=None):
+    """Run news, geo, sector and sanctions analysis of one transaction concurrently."""
+    entities = extraction_result["Extracted Entity"]
+    transaction_id = extraction_result["Transaction ID"]
+    return run_stages([
+        Stage("news_fetch", lambda: get_news_with_full_content(entities), NEWS_STAGE_TIMEOUT, default={}),
+        Stage("news_scores", news_sentiment_analysis_score, NEWS_STAGE_TIMEOUT, default={}, depends_on=["news_fetch"]),
+        Stage("geo_risk", lambda: geo_risk_analysis(extraction_result["Countries"]), GEO_STAGE_TIMEOUT, default={}),
+        Stage("sectors", lambda: getSectors(entities, extraction_result["Entity Type"]), SECTOR_STAGE_TIMEOUT, default={}),
+        Stage("sanctions", lambda: screen_entities(sanction_cases), SANCTIONS_STAGE_TIMEOUT, default=(None, None)),
+    ], progress=lambda stage, status: report_progress(progress, stage, status, transaction_id))
+
+def finalize_transaction(extraction_result, stage_results, sanction_cases, progress=None):
+    """Attach the stage results, score the transaction and return its (combined_result, final_output)."""
+    extraction_result["Real Time News Analysis of Entities Involved in the transaction"] = stage_results["news_scores"]
+    extraction_result["Geo Risk Analysis Results of Entities Involved"] = stage_results["geo_risk"]
+    extraction_result["Sectors associated with Extracted Entities"] = stage_results["sectors"]
+
+    # Sanction Screening (the LLM sanctions analysis is only written for cases the rules escalate)
+    screening = stage_results["sanctions"]
+    extraction_result["Sanction Screening"] = sanctions_hits(*screening)
+    assessment = rule_based_verdict(extraction_result)
+    if needs_llm_review(assessment):
+        extraction_result["Sanction Analysis"] = getSanctionReports(sanction_cases, screening)
+    else:
+        extraction_result["Sanction Analysis"] = assessment["Risk Factors"]["Sanctions"]["Detail"]
+
+    verdict_response = verdict(extraction_result, assessment)
     print(json.dumps(verdict_response, indent=4))
 
     combined_result = {
         "Findings" : extraction_result,
-        "implementation_details" : implementation_details
+        "implementation_details" : IMPLEMENTATION_DETAILS
     }
-    combined_results.append(combined_result)
-    
-    
+
     final_output = {
         "Transaction ID": extraction_result["Transaction ID"],
         "Extracted Entity": extraction_result["Extracted Entity"],
@@ -130,14 +150,43 @@ def app(transactions):
     }
 
     print(json.dumps(final_output, indent=4))
-    final_outputs.append(final_output)
-  root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-  save_path = os.path.join(root_dir, "datasets", "result.json")
-  os.makedirs(os.path.dirname(save_path), exist_ok=True)
-  with open(save_path, "w", encoding="utf-8") as file:
-      json.dump(combined_results, file, indent=4, ensure_ascii=False)
-  return final_outputs
+    report_progress(progress, "verdict", "done", extraction_result["Transaction ID"])
+    return combined_result, final_output
+
+def iter_screening_results(transactions, progress=None):
+  """Screen transactions given as text, a list or any iterable (e.g. iter_transactions(path)).
+
+  Yields a (combined_result, final_output) pair per transaction as soon as it is done.
+  `progress`, if given, receives an event dict as each stage of each transaction finishes.
+  """
+  if isinstance(transactions, str):
+    transactions = convert_text_to_transactions(transactions)
+  elif isinstance(transactions, dict):
+    transactions = [transactions]
+  for chunk in chunked(transactions, APP_CHUNK_SIZE):
+    # Extraction, Enrichment, Classification (NER is batched across the transactions of a chunk)
+    extraction_results = process_transactions(chunk)
+    for extraction_result in extraction_results:
+      print(extraction_result)
+      report_progress(progress, "extraction", "done", extraction_result["Transaction ID"])
+
+      # News, Geo Risk, Sector and Sanctions analysis only depend on the extraction result
+      sanction_cases = sanction_cases_for(extraction_result)
+      stage_results = run_analysis_stages(extraction_result, sanction_cases, progress)
+      yield finalize_transaction(extraction_result, stage_results, sanction_cases, progress)
+
+def app(transactions, save_path=RESULT_PATH, progress=None):
+  """Screen transactions, appending each combined result to `save_path` (JSON lines) as soon as it is done.
+
+  Yields each final output as it is written; earlier runs' results in `save_path` are kept.
+  """
+  with ResultWriter(save_path, append=True) as writer:
+    for combined_result, final_output in iter_screening_results(transactions, progress):
+      writer.write(combined_result)
+      yield final_output
 
 if __name__ == "__main__":
+    start_models()
     sample_transaction = {}
-    app(sample_transaction)
\ No newline at end of file
+    for final_output in app(sample_transaction):
+        pass
@@ -0,0 +1,99 @@
+import os
+import threading
+from transformers import pipeline, AutoTokenizer, BertTokenizer, BertForSequenceClassification
+
+NER_MODEL_NAME = "dslim/bert-base-NER"
+ZERO_SHOT_MODEL_NAME = "FacebookAI/roberta-large-mnli"
+FINBERT_MODEL_NAME = "ProsusAI/finbert"
+# Small instruction-tuned model used by the "transformers" LLM backend as a local stand-in for Mistral
+LOCAL_LLM_MODEL_NAME = os.getenv("LOCAL_LLM_MODEL", "Qwen/Qwen2.5-0.5B-Instruct")
+# Tokenizer of the remote/Ollama LLM, used to budget prompt sections
+PROMPT_TOKENIZER_NAME = os.getenv("PROMPT_TOKENIZER_MODEL", "mistralai/Mistral-7B-Instruct-v0.1")
+
+_models = {}
+_lock = threading.Lock()
+
+
+def _load_ner():
+    return pipeline("ner", model=NER_MODEL_NAME, aggregation_strategy="max")
+
+
+def _load_zero_shot():
+    return pipeline("zero-shot-classification", model=ZERO_SHOT_MODEL_NAME)
+
+
+def _load_finbert():
+    tokenizer = BertTokenizer.from_pretrained(FINBERT_MODEL_NAME)
+    model = BertForSequenceClassification.from_pretrained(FINBERT_MODEL_NAME)
+    model.eval()
+    return tokenizer, model
+
+
+def _load_text_generation():
+    generator = pipeline("text-generation", model=LOCAL_LLM_MODEL_NAME)
+    # Batched generation pads on the left so every prompt ends where generation starts
+    generator.tokenizer.padding_side = "left"
+    if generator.tokenizer.pad_token_id is None:
+        generator.tokenizer.pad_token = generator.tokenizer.eos_token
+    return generator
+
+
+def _load_prompt_tokenizer():
+    return AutoTokenizer.from_pretrained(PROMPT_TOKENIZER_NAME)
+
+
+_LOADERS = {
+    "ner": _load_ner,
+    "zero-shot": _load_zero_shot,
+    "finbert": _load_finbert,
+    "text-generation": _load_text_generation,
+    "prompt-tokenizer": _load_prompt_tokenizer,
+}
+# The local LLM is only loaded when asked for by name
+DEFAULT_WARM_UP = ["ner", "zero-shot", "finbert"]
+
+
+def get_model(name):
+    """Return the process-wide instance of a model, loading it on first use."""
+    model = _models.get(name)
+    if model is not None:
+        return model
+    with _lock:
+        if name not in _models:
+            print(f"Loading model '{name}'...")
+            _models[name] = _LOADERS[name]()
+        return _models[name]
+
+
+def get_ner_pipeline():
+    return get_model("ner")
+
+
+def get_zero_shot_classifier():
+    return get_model("zero-shot")
+
+
+def get_finbert():
+    """Return the (tokenizer, model) pair for FinBERT."""
+    return get_model("finbert")
+
+
+def get_text_generator():
+    return get_model("text-generation")
+
+
+def warm_up(names=None):
+    """Load the given models (the pipeline models by default) so the first request pays no load cost."""
+    for name in names or DEFAULT_WARM_UP:
+        get_model(name)
+
+
+def warm_up_from_env():
+    """Warm up the models listed in WARM_UP_MODELS ("all" or a comma-separated list of names)."""
+    value = os.getenv("WARM_UP_MODELS", "").strip()
+    if not value:
+        return
+    if value.lower() in ("1", "true", "all"):
+        warm_up()
+    else:
+        warm_up([name.strip() for name in value.split(",") if name.strip()])
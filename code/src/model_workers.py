@@ -0,0 +1,107 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Number of model-hosting processes; 0 runs the models in the calling process
+MODEL_WORKERS = int(os.getenv("MODEL_WORKERS", "0"))
+# Torch threads per worker; by default the cores are split evenly so workers do not oversubscribe them
+MODEL_WORKER_TORCH_THREADS = int(os.getenv("MODEL_WORKER_TORCH_THREADS", "0"))
+# Inputs smaller than this are not split further; process hops cost more than they save on tiny shards.
+# Smaller inputs still go to a worker (as one shard), so the calling process never loads the models.
+MODEL_WORKER_MIN_SHARD = int(os.getenv("MODEL_WORKER_MIN_SHARD", "16"))
+MODEL_WORKER_MODELS = [name.strip() for name in os.getenv("MODEL_WORKER_MODELS", "ner,zero-shot,finbert").split(",") if name.strip()]
+
+_pool = None
+_pool_size = 0
+_pool_initargs = None
+_pool_lock = threading.Lock()
+
+def _init_worker(torch_threads, model_names):
+    os.environ["OMP_NUM_THREADS"] = str(torch_threads)
+    os.environ["MKL_NUM_THREADS"] = str(torch_threads)
+    import torch
+    torch.set_num_threads(torch_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Already fixed once any parallel work ran in this process
+        pass
+    from model_registry import warm_up
+    warm_up(model_names)
+
+def start_model_workers(workers=MODEL_WORKERS, torch_threads=MODEL_WORKER_TORCH_THREADS, model_names=None):
+    """Start the model worker processes (each loads its models once); returns False when worker mode is off."""
+    global _pool, _pool_size, _pool_initargs
+    # Spawned workers re-import the parent's main module; they must not start pools of their own
+    if workers <= 0 or multiprocessing.parent_process() is not None:
+        return False
+    with _pool_lock:
+        if _pool is None:
+            torch_threads = torch_threads or max(1, (os.cpu_count() or 1) // workers)
+            print(f"Starting {workers} model workers with {torch_threads} torch threads each")
+            _pool_size = workers
+            _pool_initargs = (torch_threads, model_names or MODEL_WORKER_MODELS)
+            _pool = _new_pool()
+    return True
+
+def _new_pool():
+    return ProcessPoolExecutor(
+        max_workers=_pool_size,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=_pool_initargs,
+    )
+
+def _replace_broken_pool(broken):
+    """Swap a pool whose worker died (OOM, crash in torch) for a fresh one; other callers may have done it already."""
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            broken.shutdown(wait=False, cancel_futures=True)
+            _pool = _new_pool()
+        return _pool
+
+def start_models():
+    """Entry-point setup: start the model workers, or warm up this process per WARM_UP_MODELS when worker mode is off.
+
+    Does nothing in worker processes, which load their models in _init_worker.
+    """
+    if multiprocessing.parent_process() is not None:
+        return
+    if not start_model_workers():
+        from model_registry import warm_up_from_env
+        warm_up_from_env()
+
+def stop_model_workers():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+def map_shards(fn, items):
+    """Call `fn` on contiguous shards of `items` across the model workers; returns the per-shard results in order.
+
+    `fn` must be a module-level function. Without workers it is called once on all items in process.
+    With workers every call runs in them, however small, so the models are only ever loaded (and their
+    torch threads only pinned) in the workers; if a worker dies mid-call the pool is replaced and the
+    call is retried once.
+    """
+    items = list(items)
+    pool = _pool
+    if pool is None:
+        return [fn(items)]
+    shard_count = max(1, min(_pool_size, len(items) // MODEL_WORKER_MIN_SHARD))
+    shard_size = max(1, -(-len(items) // shard_count))
+    shards = [items[start:start + shard_size] for start in range(0, len(items), shard_size)] or [items]
+    try:
+        return list(pool.map(fn, shards))
+    except BrokenProcessPool as e:
+        print(f"A model worker died ({e}); restarting the model workers and retrying")
+        pool = _replace_broken_pool(pool)
+        if pool is None:
+            # The workers were stopped meanwhile
+            return [fn(items)]
+        return list(pool.map(fn, shards))
@@ -0,0 +1,96 @@
+import re
+import math
+import unicodedata
+from collections import defaultdict
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+# Bump whenever normalize_name's output changes; stores keyed on normalized names record it and are rebuilt
+# (1: accents only, 2: Cyrillic and other letters without a decomposition transliterated)
+NORMALIZATION_VERSION = 2
+
+# Cyrillic has no NFKD decomposition to Latin, so it is transliterated explicitly
+_CYRILLIC = dict(zip(
+    "абвгдеёжзийклмнопрстуфхцчшщъыьэюяіїєґў",
+    ["a", "b", "v", "g", "d", "e", "e", "zh", "z", "i", "y", "k", "l", "m", "n", "o", "p", "r", "s", "t", "u", "f",
+     "kh", "ts", "ch", "sh", "shch", "", "y", "", "e", "yu", "ya", "i", "yi", "ye", "g", "u"],
+))
+_TRANSLITERATION = str.maketrans({**_CYRILLIC, "ß": "ss", "æ": "ae", "ø": "o", "œ": "oe", "ł": "l", "đ": "d", "ð": "d", "þ": "th", "ı": "i"})
+
+def normalize_name(name):
+    """Lowercase, transliterate to ASCII and collapse punctuation/whitespace."""
+    name = (name or "").casefold().translate(_TRANSLITERATION)
+    name = unicodedata.normalize("NFKD", name)
+    name = "".join(ch for ch in name if not unicodedata.combining(ch))
+    return _NON_ALNUM.sub(" ", name).strip()
+
+def sorted_tokens_key(normalized):
+    """Word-order independent form of a normalized name ("putin vladimir" == "vladimir putin")."""
+    return " ".join(sorted(normalized.split()))
+
+def name_trigrams(normalized):
+    padded = f" {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+class NameIndex:
+    """Trigram inverted index used to narrow a large name list to a few candidates.
+
+    Candidates are ranked by the IDF-weighted trigrams they share with the query;
+    trigrams present in more than `max_df` of all names carry no signal and are
+    skipped, which keeps lookups to a handful of short posting lists.
+    """
+
+    def __init__(self, names, max_df=0.05):
+        self.names = list(names)
+        self.normalized = [normalize_name(name) for name in self.names]
+        postings = defaultdict(list)
+        for i, normalized in enumerate(self.normalized):
+            for gram in name_trigrams(normalized):
+                postings[gram].append(i)
+        self.max_postings = max(1, int(len(self.names) * max_df))
+        self.postings = dict(postings)
+
+    def candidates(self, query, limit=10):
+        """Return up to `limit` indices of names that look most like the query."""
+        grams = [gram for gram in name_trigrams(normalize_name(query)) if gram in self.postings]
+        if not grams:
+            return []
+        informative = [gram for gram in grams if len(self.postings[gram]) <= self.max_postings]
+        # Queries made only of very common trigrams still get the rarest of them
+        if not informative:
+            informative = sorted(grams, key=lambda gram: len(self.postings[gram]))[:3]
+
+        scores = defaultdict(float)
+        for gram in informative:
+            posting = self.postings[gram]
+            weight = math.log(1 + len(self.names) / len(posting))
+            for i in posting:
+                scores[i] += weight
+        return sorted(scores, key=scores.get, reverse=True)[:limit]
+
+    def candidate_names(self, query, limit=10):
+        return [self.names[i] for i in self.candidates(query, limit)]
+
+_SOUNDEX_CODES = {
+    **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"), **dict.fromkeys("dt", "3"),
+    "l": "4", **dict.fromkeys("mn", "5"), "r": "6",
+}
+
+def soundex(token):
+    """American Soundex code of a single normalized token."""
+    if not token:
+        return ""
+    code = token[0]
+    previous = _SOUNDEX_CODES.get(token[0], "")
+    for ch in token[1:]:
+        digit = _SOUNDEX_CODES.get(ch, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        if ch not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+def phonetic_key(normalized):
+    """Word-order independent phonetic form of a normalized name."""
+    return " ".join(sorted(soundex(token) for token in normalized.split() if not token.isdigit()))
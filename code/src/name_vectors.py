@@ -0,0 +1,153 @@
+import os
+import json
+import zlib
+import pickle
+import hashlib
+import numpy as np
+from scipy import sparse
+from name_index import NORMALIZATION_VERSION
+
+N_FEATURES = 2 ** 18
+# Bigrams match too many names to keep the sparse products small; padded trigrams still catch word edges
+NGRAM_SIZES = (3,)
+QUERY_CHUNK_SIZE = 1024
+
+def _ngram_ids(normalized, n_features=N_FEATURES):
+    padded = f" {normalized} "
+    ids = []
+    for n in NGRAM_SIZES:
+        for i in range(len(padded) - n + 1):
+            # crc32 rather than hash(): the ids must be stable across processes for the index to be reusable
+            ids.append(zlib.crc32(padded[i:i + n].encode("utf-8")) % n_features)
+    return ids
+
+def _count_matrix(names, n_features=N_FEATURES):
+    indptr, indices = [0], []
+    for name in names:
+        indices.extend(sorted(set(_ngram_ids(name, n_features))))
+        indptr.append(len(indices))
+    data = np.ones(len(indices), dtype=np.float32)
+    return sparse.csr_matrix(
+        (data, np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(len(names), n_features),
+    )
+
+def _l2_normalize(matrix):
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+    norms[norms == 0] = 1.0
+    return sparse.diags(1.0 / norms).dot(matrix).tocsr().astype(np.float32)
+
+def names_fingerprint(names):
+    # The names are normalized by the caller; indexes built under another normalization are rebuilt
+    digest = hashlib.sha1(f"normalization-{NORMALIZATION_VERSION}\0".encode("utf-8"))
+    for name in names:
+        digest.update(name.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def source_fingerprint(paths, *extra):
+    """Fingerprint of the files an index is built from (path, size, mtime), without reading them."""
+    digest = hashlib.sha1(f"normalization-{NORMALIZATION_VERSION}\0".encode("utf-8"))
+    for part in extra:
+        digest.update(f"{part}\0".encode("utf-8"))
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            digest.update(f"{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0".encode("utf-8"))
+        except OSError:
+            digest.update(f"{os.path.abspath(path)}\0missing\0".encode("utf-8"))
+    return digest.hexdigest()
+
+class NameVectorIndex:
+    """Flat character n-gram TF-IDF index for name similarity search.
+
+    Names (already normalized) are hashed into N_FEATURES dimensions, weighted by
+    IDF and L2-normalized, so a sparse dot product gives their cosine similarity.
+    The index saves to plain .npy files and loads them memory-mapped.
+    """
+
+    def __init__(self, matrix, idf, fingerprint=None):
+        self.matrix = matrix
+        self.idf = idf
+        self.fingerprint = fingerprint
+
+    @classmethod
+    def build(cls, names, fingerprint=None):
+        counts = _count_matrix(names)
+        document_frequency = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = (np.log((1 + counts.shape[0]) / (1 + document_frequency)) + 1).astype(np.float32)
+        matrix = _l2_normalize(counts.dot(sparse.diags(idf)))
+        return cls(matrix, idf, fingerprint or names_fingerprint(names))
+
+    def vectorize(self, names):
+        return _l2_normalize(_count_matrix(names).dot(sparse.diags(self.idf)))
+
+    def query(self, names, k=10, min_similarity=0.0):
+        """Top-k rows for each query name, as lists of (row, cosine similarity) best first."""
+        if not names or self.matrix.shape[0] == 0:
+            return [[] for _ in names]
+        results = []
+        for start in range(0, len(names), QUERY_CHUNK_SIZE):
+            results.extend(self._query_chunk(names[start:start + QUERY_CHUNK_SIZE], k, min_similarity))
+        return results
+
+    def _query_chunk(self, names, k, min_similarity):
+        similarities = self.vectorize(names).dot(self.matrix.T).tocsr()
+        results = []
+        for row in range(similarities.shape[0]):
+            start, end = similarities.indptr[row], similarities.indptr[row + 1]
+            scores, columns = similarities.data[start:end], similarities.indices[start:end]
+            if len(scores) > k:
+                top = np.argpartition(-scores, k)[:k]
+                scores, columns = scores[top], columns[top]
+            order = np.argsort(-scores)
+            results.append([
+                (int(columns[i]), float(scores[i])) for i in order if scores[i] >= min_similarity
+            ])
+        return results
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "data.npy"), self.matrix.data)
+        np.save(os.path.join(directory, "indices.npy"), self.matrix.indices)
+        np.save(os.path.join(directory, "indptr.npy"), self.matrix.indptr)
+        np.save(os.path.join(directory, "idf.npy"), self.idf)
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as file:
+            json.dump({"shape": list(self.matrix.shape), "fingerprint": self.fingerprint}, file)
+
+    @classmethod
+    def load(cls, directory):
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as file:
+            meta = json.load(file)
+        arrays = {
+            name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+            for name in ("data", "indices", "indptr", "idf")
+        }
+        matrix = sparse.csr_matrix(
+            (arrays["data"], arrays["indices"], arrays["indptr"]), shape=tuple(meta["shape"]), copy=False
+        )
+        return cls(matrix, arrays["idf"], meta.get("fingerprint"))
+
+def load_or_build(directory, fingerprint, build):
+    """Return (data, vectors) saved in `directory` under `fingerprint`, else build, save and return them.
+
+    `build()` parses the sources and returns (data, normalized names). The data (name lists, key maps,
+    records) is pickled next to the vector .npy files, so a warm start unpickles it and memory-maps
+    the vectors instead of re-reading and re-normalizing the source lists.
+    """
+    data_path = os.path.join(directory, "data.pickle") if directory else None
+    if data_path and os.path.exists(data_path) and os.path.exists(os.path.join(directory, "meta.json")):
+        vectors = NameVectorIndex.load(directory)
+        if vectors.fingerprint == fingerprint:
+            with open(data_path, "rb") as file:
+                return pickle.load(file), vectors
+    data, names = build()
+    vectors = NameVectorIndex.build(names, fingerprint)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        # Written before the vectors, whose meta.json fingerprint is what marks the pair as current
+        with open(data_path + ".tmp", "wb") as file:
+            pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(data_path + ".tmp", data_path)
+        vectors.save(directory)
+    return data, vectors
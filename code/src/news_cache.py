@@ -0,0 +1,23 @@
+import os
+from kv_cache import PersistentCache
+
+NEWS_QUERY_CACHE_TTL = int(os.getenv("NEWS_QUERY_CACHE_TTL", str(6 * 60 * 60)))
+ARTICLE_CACHE_TTL = int(os.getenv("ARTICLE_CACHE_TTL", str(7 * 24 * 60 * 60)))
+NEWS_CACHE_MAX_BYTES = int(os.getenv("NEWS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# NewsAPI results keyed by company query
+news_query_cache = PersistentCache("news_query", NEWS_QUERY_CACHE_TTL, NEWS_CACHE_MAX_BYTES)
+# Scraped article bodies keyed by URL, together with their FinBERT score and keyword hits
+article_cache = PersistentCache("news_article", ARTICLE_CACHE_TTL, NEWS_CACHE_MAX_BYTES)
+
+def remember_article_analysis(article):
+    """Store the computed sentiment score and keyword hits next to a cached article body."""
+    url = article.get("url")
+    if not url:
+        return
+    entry = article_cache.get(url)
+    if entry is None or entry.get("full_content") != article.get("full_content"):
+        return
+    entry["sentiment_score"] = article.get("sentiment_score")
+    entry["risk_keywords"] = article.get("risk_keywords")
+    article_cache.set(url, entry)
@@ -1,50 +1,127 @@
 import requests
 from bs4 import BeautifulSoup
-import json
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from news_cache import news_query_cache, article_cache
+from debug_sink import debug_dump
 
 load_dotenv()
 
 NEWS_API_KEY = os.getenv("NEWS_API_KEY")
+NEWS_API_URL = "https://newsapi.org/v2/everything"
 
-def get_news_with_full_content(companies=None):
+NEWS_FETCH_WORKERS = int(os.getenv("NEWS_FETCH_WORKERS", "16"))
+NEWS_PER_HOST_CONCURRENCY = int(os.getenv("NEWS_PER_HOST_CONCURRENCY", "4"))
+NEWS_REQUEST_TIMEOUT = float(os.getenv("NEWS_REQUEST_TIMEOUT", "10"))
+NEWS_FETCH_DEADLINE = float(os.getenv("NEWS_FETCH_DEADLINE", "30"))
+
+ARTICLE_NOT_AVAILABLE = "Full article not available."
+
+# Shared connection-pooled session; requests.Session is safe to share for plain GETs
+_session = requests.Session()
+_adapter = HTTPAdapter(pool_connections=NEWS_FETCH_WORKERS, pool_maxsize=NEWS_FETCH_WORKERS)
+_session.mount("http://", _adapter)
+_session.mount("https://", _adapter)
+_session.headers.update({"User-Agent": "Mozilla/5.0"})
+
+_host_limits = {}
+_host_limits_lock = threading.Lock()
+
+def _host_limit(url):
+    host = urlparse(url).netloc
+    with _host_limits_lock:
+        if host not in _host_limits:
+            _host_limits[host] = threading.BoundedSemaphore(NEWS_PER_HOST_CONCURRENCY)
+        return _host_limits[host]
+
+def _get(url, **kwargs):
+    with _host_limit(url):
+        return _session.get(url, timeout=NEWS_REQUEST_TIMEOUT, **kwargs)
+
+def fetch_news(company_name):
+    cached = news_query_cache.get(company_name)
+    if cached is not None:
+        return cached
+    params = {"q": f"{company_name} lawsuit OR fraud OR sanction", "apiKey": NEWS_API_KEY}
+    try:
+        response = _get(NEWS_API_URL, params=params)
+    except requests.RequestException as e:
+        print(f"⚠️ Error fetching news for {company_name}: {e}")
+        return []
+    if response.status_code != 200:
+        print(f"⚠️ Error fetching news for {company_name}: {response.text}")
+        return []
+    try:
+        articles = response.json().get("articles", [])
+    except (ValueError, AttributeError) as e:
+        # An HTML error or rate-limit page (or unexpected JSON); only this company's news is lost
+        print(f"⚠️ Unreadable news response for {company_name}: {e}")
+        return []
+    news_query_cache.set(company_name, articles)
+    return articles
+
+def scrape_full_article(url):
+    try:
+        response = _get(url)
+        soup = BeautifulSoup(response.text, "html.parser")
+        paragraphs = soup.find_all("p")
+        article_text = "\n".join([p.get_text() for p in paragraphs if len(p.get_text()) > 20])
+        article_text = article_text.strip() if article_text else ARTICLE_NOT_AVAILABLE
+    except Exception as e:
+        return f"Error fetching full article: {e}"
+    article_cache.set(url, {"full_content": article_text})
+    return article_text
+
+def get_news_with_full_content(companies=None, deadline=NEWS_FETCH_DEADLINE):
+    """Fetch news for all companies and scrape their articles concurrently.
+
+    Whatever has not arrived once `deadline` seconds have passed is left out
+    (companies) or kept without its scraped body (articles).
+    """
     if not NEWS_API_KEY:
         raise ValueError("NEWS_API_KEY environment variable is not set!")
 
-    def fetch_news(company_name):
-        url = f"https://newsapi.org/v2/everything?q={company_name} lawsuit OR fraud OR sanction&apiKey={NEWS_API_KEY}"
-        response = requests.get(url)
-        if response.status_code != 200:
-            print(f"⚠️ Error fetching news for {company_name}: {response.text}")
-            return []
-        return response.json().get("articles", [])
-
-    def scrape_full_article(url):
-        try:
-            headers = {"User-Agent": "Mozilla/5.0"}
-            response = requests.get(url, headers=headers)
-            soup = BeautifulSoup(response.text, "html.parser")
-            paragraphs = soup.find_all("p")
-            article_text = "\n".join([p.get_text() for p in paragraphs if len(p.get_text()) > 20])
-            return article_text.strip() if article_text else "Full article not available."
-        except Exception as e:
-            return f"Error fetching full article: {e}"
-
+    companies = list(dict.fromkeys(companies or []))
     news_data = {}
+    end_time = time.monotonic() + deadline
+    executor = ThreadPoolExecutor(max_workers=NEWS_FETCH_WORKERS)
+    try:
+        pending = {}
+        for company in companies:
+            print(f"Fetching news for {company}...")
+            pending[executor.submit(fetch_news, company)] = (company, None)
 
-    for company in companies:
-        print(f"Fetching news for {company}...")
-        news_articles = fetch_news(company)
-        for article in news_articles:
-            article["full_content"] = scrape_full_article(article["url"])
-        news_data[company] = news_articles
+        while pending:
+            remaining = end_time - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                company, article = pending.pop(future)
+                if article is None:
+                    news_articles = future.result()
+                    news_data[company] = news_articles
+                    cached_articles = article_cache.get_many([news_article["url"] for news_article in news_articles])
+                    for news_article in news_articles:
+                        if news_article["url"] in cached_articles:
+                            # Cached body, plus its sentiment score and keyword hits when already computed
+                            news_article.update(cached_articles[news_article["url"]])
+                            continue
+                        news_article["full_content"] = ARTICLE_NOT_AVAILABLE
+                        pending[executor.submit(scrape_full_article, news_article["url"])] = (company, news_article)
+                else:
+                    article["full_content"] = future.result()
 
-    root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-    save_path = os.path.join(root_dir, "artifacts", "arch", "news_with_full_content.json")
-    os.makedirs(os.path.dirname(save_path), exist_ok=True)
-    with open(save_path, "w", encoding="utf-8") as file:
-        json.dump(news_data, file, indent=4, ensure_ascii=False)
-    print(f"News data with full content saved to {save_path}")
+        missing = [company for company in companies if company not in news_data]
+        if missing:
+            print(f"⚠️ News fetch deadline reached, no results for: {', '.join(missing)}")
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
 
+    debug_dump("news_with_full_content.json", news_data)
     return news_data
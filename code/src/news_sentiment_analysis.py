@@ -2,13 +2,11 @@ import json
 import re
 import torch
 import os
-from transformers import BertTokenizer, BertForSequenceClassification
 from scipy.special import softmax
-
-
-MODEL_NAME = "ProsusAI/finbert"
-tokenizer = BertTokenizer.from_pretrained(MODEL_NAME)
-model = BertForSequenceClassification.from_pretrained(MODEL_NAME)
+from model_registry import get_finbert
+from news_cache import remember_article_analysis
+from model_workers import map_shards
+from debug_sink import debug_dump, artifact_path
 
 
 RISK_KEYWORDS = {
@@ -23,13 +21,21 @@ RISK_KEYWORDS = {
 
 MAX_ARTICLE_SCORE = 10
 
-def analyze_sentiment(text):
-    inputs = tokenizer(text, return_tensors="pt", truncation=True, padding=True, max_length=512)
-    with torch.no_grad():
-        outputs = model(**inputs)
-    scores = softmax(outputs.logits.numpy()[0])
-    neg, neu, pos = scores
+# One case-insensitive pattern for every keyword. The zero-width lookahead lets
+# overlapping keywords ("fraud" inside "financial fraud") all match in one scan.
+_KEYWORD_BY_LOWER = {keyword.lower(): keyword for keyword in RISK_KEYWORDS}
+_KEYWORD_PATTERN = re.compile(
+    r"(?=\b(" + "|".join(re.escape(k) for k in sorted(_KEYWORD_BY_LOWER, key=len, reverse=True)) + r")\b)",
+    re.IGNORECASE,
+)
+
+def match_risk_keywords(text):
+    """Return the set of RISK_KEYWORDS found in the text, in a single pass."""
+    return {_KEYWORD_BY_LOWER[match.group(1).lower()] for match in _KEYWORD_PATTERN.finditer(text)}
+
+SENTIMENT_BATCH_SIZE = int(os.getenv("SENTIMENT_BATCH_SIZE", "16"))
 
+def sentiment_bucket(neg, neu):
     if neg > 0.8:
         return 15  
     elif neg > 0.6:
@@ -41,11 +47,32 @@ def analyze_sentiment(text):
     else:
         return 1  
 
-def detect_historical_fraud(news_articles, company_name):
-    fraud_news_count = sum(
-        1 for article in news_articles
-        if any(re.search(rf"\b{keyword}\b", article.get("full_content", "").lower()) for keyword in RISK_KEYWORDS)
-    )
+def analyze_sentiments(texts, batch_size=SENTIMENT_BATCH_SIZE):
+    """Score many texts with FinBERT, batching length-sorted inputs to keep padding low."""
+    if not texts:
+        return []
+    tokenizer, model = get_finbert()
+    encodings = tokenizer(list(texts), truncation=True, max_length=512)["input_ids"]
+    order = sorted(range(len(encodings)), key=lambda i: len(encodings[i]))
+
+    results = [None] * len(encodings)
+    with torch.inference_mode():
+        for start in range(0, len(order), batch_size):
+            batch_indices = order[start:start + batch_size]
+            inputs = tokenizer.pad({"input_ids": [encodings[i] for i in batch_indices]}, return_tensors="pt")
+            outputs = model(**inputs)
+            for i, scores in zip(batch_indices, softmax(outputs.logits.numpy(), axis=-1)):
+                neg, neu, pos = scores
+                results[i] = sentiment_bucket(neg, neu)
+    return results
+
+def analyze_sentiment(text):
+    return analyze_sentiments([text])[0]
+
+def detect_historical_fraud(news_articles, company_name, keyword_hits=None):
+    if keyword_hits is None:
+        keyword_hits = [match_risk_keywords(article_text(article)) for article in news_articles]
+    fraud_news_count = sum(1 for hits in keyword_hits if hits)
 
     HIGH_PROFILE_FRAUD = ["Wirecard", "Enron", "FTX", "Madoff", "Theranos"]
     if company_name in HIGH_PROFILE_FRAUD:
@@ -60,47 +87,71 @@ def detect_historical_fraud(news_articles, company_name):
     else:
         return 0  
 
-def analyze_risk(company_name, news_articles):
+def article_text(article):
+    return article.get("full_content", f"{article.get('title', '')} {article.get('description', '')}").lower()
+
+def analyze_risk(company_name, news_articles, sentiment_scores=None):
     if not news_articles:
         return 0  
 
-    total_score = 0
-    for article in news_articles:
-        text = article.get("full_content", f"{article.get('title', '')} {article.get('description', '')}").lower()
-        sentiment_risk = analyze_sentiment(text)
+    if sentiment_scores is None:
+        sentiment_scores = analyze_sentiments([article_text(article) for article in news_articles])
+
+    keyword_hits = [
+        set(article["risk_keywords"]) if article.get("risk_keywords") is not None else match_risk_keywords(article_text(article))
+        for article in news_articles
+    ]
 
-        unique_keywords = {keyword for keyword in RISK_KEYWORDS if re.search(rf"\b{keyword}\b", text)}
+    total_score = 0
+    for sentiment_risk, unique_keywords in zip(sentiment_scores, keyword_hits):
         keyword_risk = min(sum(RISK_KEYWORDS[keyword] for keyword in unique_keywords), MAX_ARTICLE_SCORE)
 
         article_score = (sentiment_risk + keyword_risk) / 2  
         total_score += article_score
 
     normalized_score = (total_score / (len(news_articles) + 1)) * 10
-    fraud_boost = detect_historical_fraud(news_articles, company_name)
+    fraud_boost = detect_historical_fraud(news_articles, company_name, keyword_hits)
     final_score = min(100, round(normalized_score + fraud_boost, 2))
 
     return final_score
 
-
-def news_sentiment_analysis_score():
-    root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
-    news_file_path = os.path.join(root_dir, "artifacts", "arch", "news_with_full_content.json")
-    risk_score_save_path = os.path.join(root_dir, "artifacts", "arch", "transaction_risk_scores.json")
-
-    os.makedirs(os.path.dirname(news_file_path), exist_ok=True)
-    os.makedirs(os.path.dirname(risk_score_save_path), exist_ok=True)
-
-    with open(news_file_path, "r", encoding="utf-8") as file:
-        news_data = json.load(file)
-
-    risk_scores = {company: analyze_risk(company, articles) for company, articles in news_data.items()}
+def score_companies(news_data):
+    """Score every company's articles, running FinBERT once over all articles of all companies.
+
+    Articles that already carry a cached sentiment score and keyword hits are not rescored;
+    newly computed values are written back to the article cache.
+    """
+    articles = [article for company_articles in news_data.values() for article in company_articles]
+    unscored = [article for article in articles if article.get("sentiment_score") is None]
+    texts = [article_text(article) for article in unscored]
+    sentiment_scores = [score for shard in map_shards(analyze_sentiments, texts) for score in shard]
+    for article, sentiment_score in zip(unscored, sentiment_scores):
+        article["sentiment_score"] = sentiment_score
+    for article in articles:
+        if article.get("risk_keywords") is None:
+            article["risk_keywords"] = sorted(match_risk_keywords(article_text(article)))
+    for article in unscored:
+        remember_article_analysis(article)
+
+    return {
+        company: analyze_risk(company, company_articles, [article["sentiment_score"] for article in company_articles])
+        for company, company_articles in news_data.items()
+    }
+
+
+def news_sentiment_analysis_score(news_data=None):
+    """Score the news returned by get_news_with_full_content.
+
+    Without `news_data` the last debug dump of the news stage is read instead.
+    """
+    if news_data is None:
+        with open(artifact_path("news_with_full_content.json"), "r", encoding="utf-8") as file:
+            news_data = json.load(file)
+
+    risk_scores = score_companies(news_data)
 
     for company, score in risk_scores.items():
         print(f"Risk Score for {company}: {score}/100")
 
-    with open(risk_score_save_path, "w", encoding="utf-8") as file:
-        json.dump(risk_scores, file, indent=4, ensure_ascii=False)
-
-    print(f"Risk scores saved to {risk_score_save_path}")
-
-    
+    debug_dump("transaction_risk_scores.json", risk_scores)
+    return risk_scores
@@ -1,24 +1,144 @@
 import os
+import csv
+import json
+import threading
 from dotenv import load_dotenv
 import requests
+from fuzzywuzzy import fuzz
+from kv_cache import PersistentCache
+from name_index import normalize_name, sorted_tokens_key
+import name_vectors
 
 load_dotenv()
 
 OPENSANCTIONS_API_KEY = os.getenv("OPENSANCTIONS_API_KEY")
+OPENSANCTIONS_PEP_URL = "https://api.opensanctions.org/search/peps"
 
-def is_pep(name):
+# OpenSanctions PEP export (FollowTheMoney JSON lines, or the targets.simple CSV) for offline screening
+PEP_DATASET_PATH = os.getenv("PEP_DATASET_PATH")
+# Ask the OpenSanctions API when there is no local dataset (or the name is not in it, if PEP_API_FALLBACK=always)
+PEP_API_FALLBACK = os.getenv("PEP_API_FALLBACK", "missing").lower()
+PEP_CACHE_TTL = int(os.getenv("PEP_CACHE_TTL", str(7 * 24 * 60 * 60)))
+# Names missing from the exact index are matched by vector similarity, then confirmed with a fuzzy score
+PEP_MIN_SCORE = int(os.getenv("PEP_MIN_SCORE", "95"))
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+# Saved name keys and TF-IDF name vectors; rebuilt only when the dataset file changes
+PEP_VECTOR_INDEX_DIR = os.getenv("PEP_VECTOR_INDEX_DIR", os.path.join(root_dir, ".cache", "pep_vectors"))
+
+pep_cache = PersistentCache("pep", PEP_CACHE_TTL)
+
+FTM_NAME_PROPERTIES = ["name", "alias", "weakAlias", "previousName"]
+
+def _iter_ftm_people(path):
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            entity = json.loads(line)
+            if entity.get("schema") != "Person":
+                continue
+            properties = entity.get("properties", {})
+            names = [name for prop in FTM_NAME_PROPERTIES for name in properties.get(prop, [])]
+            yield entity.get("id"), names
+
+def _iter_csv_people(path):
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        for row in csv.DictReader(file):
+            if row.get("schema", "Person") != "Person":
+                continue
+            names = [row.get("name", "")] + [alias for alias in (row.get("aliases") or "").split(";") if alias]
+            yield row.get("id"), names
+
+def build_pep_index(path):
+    """Map every normalized name and alias (plus its word-order independent form) to PEP entity ids."""
+    reader = _iter_csv_people if path.lower().endswith(".csv") else _iter_ftm_people
+    index = {}
+    for entity_id, names in reader(path):
+        for name in names:
+            normalized = normalize_name(name)
+            if not normalized:
+                continue
+            index.setdefault(normalized, set()).add(entity_id)
+            index.setdefault(sorted_tokens_key(normalized), set()).add(entity_id)
+    print(f"Loaded {len(index)} PEP name keys from {path}")
+    return index
+
+def _build_pep_data():
+    index = build_pep_index(PEP_DATASET_PATH)
+    return index, list(index)
+
+_pep_index = None
+_pep_names = None
+_pep_vectors = None
+_pep_index_lock = threading.Lock()
+
+def get_pep_index():
+    """Return the local PEP index, or None when no PEP_DATASET_PATH is configured."""
+    global _pep_index, _pep_names, _pep_vectors
+    if not PEP_DATASET_PATH:
+        return None
+    if _pep_index is None:
+        with _pep_index_lock:
+            if _pep_index is None:
+                index, _pep_vectors = name_vectors.load_or_build(
+                    PEP_VECTOR_INDEX_DIR,
+                    name_vectors.source_fingerprint([PEP_DATASET_PATH], "pep-index-1"),
+                    _build_pep_data,
+                )
+                _pep_names = list(index)
+                _pep_index = index
+    return _pep_index
+
+def similar_peps(names, k=5):
+    """Batch vector search over the local PEP names; returns, per name, whether a close enough PEP exists."""
+    normalized = [normalize_name(name) for name in names]
+    results = []
+    for query, candidates in zip(normalized, _pep_vectors.query(normalized, k=k, min_similarity=0.5)):
+        results.append(any(
+            fuzz.token_sort_ratio(query, _pep_names[row], force_ascii=False, full_process=False) >= PEP_MIN_SCORE
+            for row, _ in candidates
+        ))
+    return results
+
+def lookup_pep(name, index):
+    normalized = normalize_name(name)
+    return bool(normalized) and (normalized in index or sorted_tokens_key(normalized) in index)
+
+def query_pep_api(name):
     """Use OpenSanctions API to check if a person is a Politically Exposed Person (PEP)"""
-    url = "https://api.opensanctions.org/search/peps"
+    cached = pep_cache.get(name)
+    if cached is not None:
+        return cached
     params = {"q": name, "api_key": OPENSANCTIONS_API_KEY}
     try:
-        response = requests.get(url, params=params)
+        response = requests.get(OPENSANCTIONS_PEP_URL, params=params, timeout=10)
         response.raise_for_status()
         data = response.json()
-    except requests.exceptions.RequestException as e:
-        raise Exception(f"API request failed: {e}")
-    except ValueError as e:
-        raise Exception("Failed to parse JSON response")
-    if "results" in data and data["results"]:
-        return True
-    else:
-        return False
\ No newline at end of file
+    except (requests.exceptions.RequestException, ValueError) as e:
+        # A failed lookup should not fail the whole transaction; it is not cached so it is retried next time
+        print(f"OpenSanctions PEP lookup failed for {name}: {e}")
+        return False
+    result = bool(data.get("results"))
+    pep_cache.set(name, result)
+    return result
+
+def is_pep(name):
+    """Check if a person is a Politically Exposed Person (PEP), locally when a PEP dataset is configured."""
+    return is_pep_batch([name])[name]
+
+def is_pep_batch(names):
+    """Screen many names at once; returns a dict of name -> bool."""
+    names = list(dict.fromkeys(names))
+    index = get_pep_index()
+    if index is None:
+        return {name: query_pep_api(name) if PEP_API_FALLBACK != "never" else False for name in names}
+
+    results = {name: lookup_pep(name, index) for name in names}
+    misses = [name for name in names if not results[name]]
+    if misses:
+        results.update(zip(misses, similar_peps(misses)))
+    if PEP_API_FALLBACK == "always":
+        for name in names:
+            if not results[name]:
+                results[name] = query_pep_api(name)
+    return results
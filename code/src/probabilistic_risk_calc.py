@@ -1,65 +1,99 @@
+import threading
 import numpy as np
 import skfuzzy as fuzz
 from skfuzzy import control as ctrl
 
-def calculate_risk_score(initial_risk_score, transaction_amount_input, transaction_frequency_input):
-    # Prior probabilities
-    P_fraud = 0.05  # 5% chance of fraud
-    P_not_fraud = 1 - P_fraud
+# === 1. BAYESIAN PRIOR (constant, computed once) ===
+# Prior probabilities
+P_fraud = 0.05  # 5% chance of fraud
+P_not_fraud = 1 - P_fraud
 
-    # Likelihood of evidence given fraud
-    P_evidence_given_fraud = 0.8  # High amount, unusual location, etc.
-    P_evidence_given_not_fraud = 0.1  # Low risk for normal transactions
+# Likelihood of evidence given fraud
+P_evidence_given_fraud = 0.8  # High amount, unusual location, etc.
+P_evidence_given_not_fraud = 0.1  # Low risk for normal transactions
 
-    # Bayesian update
-    P_fraud_given_evidence = (P_evidence_given_fraud * P_fraud) / (
-        (P_evidence_given_fraud * P_fraud) + (P_evidence_given_not_fraud * P_not_fraud)
-    )
+# Bayesian update
+P_fraud_given_evidence = (P_evidence_given_fraud * P_fraud) / (
+    (P_evidence_given_fraud * P_fraud) + (P_evidence_given_not_fraud * P_not_fraud)
+)
 
-    # === 2. FUZZY LOGIC BASED RISK SCORE ===
+# === 2. FUZZY LOGIC CONTROLLER (built once) ===
+MAX_AMOUNT = 35000
+MAX_FREQUENCY = 750
+LEVELS = ['low', 'medium', 'high']
 
-    # Define fuzzy variables
-    transaction_amount = ctrl.Antecedent(np.arange(0, 35001, 1), 'transaction_amount')
-    transaction_frequency = ctrl.Antecedent(np.arange(0, 751, 1), 'transaction_frequency')
-    risk_score = ctrl.Consequent(np.arange(0, 101, 1), 'risk_score')
+AMOUNT_UNIVERSE = np.arange(0, MAX_AMOUNT + 1, 1)
+FREQUENCY_UNIVERSE = np.arange(0, MAX_FREQUENCY + 1, 1)
+RISK_UNIVERSE = np.arange(0, 101, 1)
 
-    # Define fuzzy membership functions
-    transaction_amount['low'] = fuzz.trimf(transaction_amount.universe, [0, 0, 3000])
-    transaction_amount['medium'] = fuzz.trimf(transaction_amount.universe, [2000, 9000, 18000])
-    transaction_amount['high'] = fuzz.trimf(transaction_amount.universe, [10000, 20000, 35000])
+AMOUNT_MF = {
+    'low': fuzz.trimf(AMOUNT_UNIVERSE, [0, 0, 3000]),
+    'medium': fuzz.trimf(AMOUNT_UNIVERSE, [2000, 9000, 18000]),
+    'high': fuzz.trimf(AMOUNT_UNIVERSE, [10000, 20000, 35000]),
+}
+FREQUENCY_MF = {
+    'low': fuzz.trimf(FREQUENCY_UNIVERSE, [0, 0, 100]),
+    'medium': fuzz.trimf(FREQUENCY_UNIVERSE, [50, 200, 350]),
+    'high': fuzz.trimf(FREQUENCY_UNIVERSE, [250, 500, 750]),
+}
+RISK_TRIANGLES = {'low': [0, 0, 40], 'medium': [30, 50, 70], 'high': [60, 100, 100]}
+RISK_MF = {level: fuzz.trimf(RISK_UNIVERSE, abc) for level, abc in RISK_TRIANGLES.items()}
 
-    transaction_frequency['low'] = fuzz.trimf(transaction_frequency.universe, [0, 0, 100])
-    transaction_frequency['medium'] = fuzz.trimf(transaction_frequency.universe, [50, 200, 350])
-    transaction_frequency['high'] = fuzz.trimf(transaction_frequency.universe, [250, 500, 750])
+def rule_consequent(amount_level, freq_level):
+    """Risk level implied by an (amount, frequency) level pair."""
+    if amount_level == 'high' or freq_level == 'high':
+        return 'high'
+    elif amount_level == 'medium' and freq_level == 'medium':
+        return 'medium'
+    elif amount_level == 'low' and freq_level == 'low':
+        return 'low'
+    else:
+        return 'medium' if amount_level == 'medium' or freq_level == 'medium' else 'low'
 
-    risk_score['low'] = fuzz.trimf(risk_score.universe, [0, 0, 40])
-    risk_score['medium'] = fuzz.trimf(risk_score.universe, [30, 50, 70])
-    risk_score['high'] = fuzz.trimf(risk_score.universe, [60, 100, 100])
+def build_risk_control_system():
+    # Define fuzzy variables
+    transaction_amount = ctrl.Antecedent(AMOUNT_UNIVERSE, 'transaction_amount')
+    transaction_frequency = ctrl.Antecedent(FREQUENCY_UNIVERSE, 'transaction_frequency')
+    risk_score = ctrl.Consequent(RISK_UNIVERSE, 'risk_score')
+
+    # Define fuzzy membership functions
+    for level in LEVELS:
+        transaction_amount[level] = AMOUNT_MF[level]
+        transaction_frequency[level] = FREQUENCY_MF[level]
+        risk_score[level] = RISK_MF[level]
 
     # Define all possible fuzzy rules with AND and OR
     rules = []
-    for amount_level in ['low', 'medium', 'high']:
-        for freq_level in ['low', 'medium', 'high']:
-            if amount_level == 'high' or freq_level == 'high':
-                risk_level = 'high'
-            elif amount_level == 'medium' and freq_level == 'medium':
-                risk_level = 'medium'
-            elif amount_level == 'low' and freq_level == 'low':
-                risk_level = 'low'
-            else:
-                risk_level = 'medium' if amount_level == 'medium' or freq_level == 'medium' else 'low'
+    for amount_level in LEVELS:
+        for freq_level in LEVELS:
+            risk_level = rule_consequent(amount_level, freq_level)
             rules.append(ctrl.Rule(transaction_amount[amount_level] & transaction_frequency[freq_level], risk_score[risk_level]))
             rules.append(ctrl.Rule(transaction_amount[amount_level] | transaction_frequency[freq_level], risk_score[risk_level]))
 
-    # Create control system and simulation
-    risk_ctrl = ctrl.ControlSystem(rules)
-    risk_simulation = ctrl.ControlSystemSimulation(risk_ctrl)
+    return ctrl.ControlSystem(rules)
+
+RISK_CONTROL_SYSTEM = build_risk_control_system()
+
+# Simulations keep per-run state, so each thread gets its own over the shared system
+_simulations = threading.local()
+
+def _risk_simulation():
+    simulation = getattr(_simulations, "simulation", None)
+    if simulation is None:
+        simulation = ctrl.ControlSystemSimulation(RISK_CONTROL_SYSTEM)
+        _simulations.simulation = simulation
+    return simulation
+
+def calculate_risk_score(initial_risk_score, transaction_amount_input, transaction_frequency_input):
+    risk_simulation = _risk_simulation()
 
     # Apply boundary checks to inputs
-    risk_simulation.input['transaction_amount'] = min(max(transaction_amount_input, 0), 35000)
-    risk_simulation.input['transaction_frequency'] = min(max(transaction_frequency_input, 0), 750)
+    risk_simulation.input['transaction_amount'] = min(max(transaction_amount_input, 0), MAX_AMOUNT)
+    risk_simulation.input['transaction_frequency'] = min(max(transaction_frequency_input, 0), MAX_FREQUENCY)
 
-    # Compute fuzzy output
+    # Compute fuzzy output (clear the previous run's output, a reused simulation
+    # does not reset it when the new inputs produce no output membership)
+    risk_simulation.output.clear()
     risk_simulation.compute()
 
     # Debug check to ensure no KeyError
@@ -75,4 +109,58 @@ def calculate_risk_score(initial_risk_score, transaction_amount_input, transacti
     print(f"Transaction Frequency: {transaction_frequency_input}")
     print(f"Final Combined Risk Score: {final_risk_score * 100:.2f}%")
 
-    return final_risk_score
\ No newline at end of file
+    return final_risk_score
+
+def fuzzy_risk_scores(amounts, frequencies):
+    """Vectorized Mamdani inference with centroid defuzzification (0-100 scale).
+
+    Mirrors RISK_CONTROL_SYSTEM: min for AND, max for OR and rule aggregation,
+    output terms clipped at their activation and the centroid taken over the
+    piecewise-linear aggregate on the risk universe plus the clip points.
+    """
+    amounts, frequencies = np.broadcast_arrays(np.asarray(amounts, dtype=float), np.asarray(frequencies, dtype=float))
+    amounts = np.clip(amounts, 0, MAX_AMOUNT)
+    frequencies = np.clip(frequencies, 0, MAX_FREQUENCY)
+
+    amount_membership = {level: np.interp(amounts, AMOUNT_UNIVERSE, AMOUNT_MF[level]) for level in LEVELS}
+    frequency_membership = {level: np.interp(frequencies, FREQUENCY_UNIVERSE, FREQUENCY_MF[level]) for level in LEVELS}
+
+    activation = {level: np.zeros_like(amounts) for level in LEVELS}
+    for amount_level in LEVELS:
+        for freq_level in LEVELS:
+            risk_level = rule_consequent(amount_level, freq_level)
+            a, f = amount_membership[amount_level], frequency_membership[freq_level]
+            # The AND rule fires at min(a, f) and the OR rule at max(a, f); aggregated, that is max(a, f)
+            activation[risk_level] = np.maximum(activation[risk_level], np.maximum(a, f))
+
+    # Sample points: the risk universe plus, per output term, where its triangle crosses the clip level
+    extra_points = []
+    for level, (a, b, c) in RISK_TRIANGLES.items():
+        cut = activation[level]
+        extra_points.append(a + cut * (b - a))
+        extra_points.append(c - cut * (c - b))
+    points = np.concatenate(
+        [np.broadcast_to(RISK_UNIVERSE.astype(float), amounts.shape + RISK_UNIVERSE.shape), np.stack(extra_points, axis=-1)],
+        axis=-1,
+    )
+    points.sort(axis=-1)
+
+    aggregate = np.zeros_like(points)
+    for level in LEVELS:
+        clipped = np.minimum(activation[level][..., None], np.interp(points, RISK_UNIVERSE, RISK_MF[level]))
+        np.maximum(aggregate, clipped, aggregate)
+
+    # Exact centroid of the piecewise-linear aggregate
+    x1, x2 = points[..., :-1], points[..., 1:]
+    y1, y2 = aggregate[..., :-1], aggregate[..., 1:]
+    area = 0.5 * (x2 - x1) * (y1 + y2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        moment = np.where(y1 + y2 > 0, x1 + (x2 - x1) * (y1 + 2 * y2) / (3 * (y1 + y2)), 0.0)
+    total_area = area.sum(axis=-1)
+    return np.where(total_area > 0, (moment * area).sum(axis=-1) / np.fmax(total_area, np.finfo(float).eps), 0.0)
+
+def calculate_risk_scores(initial_risk_scores, transaction_amounts, transaction_frequencies):
+    """Batch version of calculate_risk_score over NumPy arrays (or scalars broadcast against them)."""
+    initial_risk_scores = np.asarray(initial_risk_scores, dtype=float)
+    fuzzy_scores = np.round(fuzzy_risk_scores(transaction_amounts, transaction_frequencies) / 100, 3)
+    return np.round((0.5 * initial_risk_scores) + (0.3 * fuzzy_scores) + (0.2 * P_fraud_given_evidence), 3)
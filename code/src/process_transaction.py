@@ -1,12 +1,13 @@
 import re
 import json
-from entity_extraction import merge_entities
-from entity_classification import classify_entity
-from entity_enrichment import query_gleif, map_iso3166_country
-from pep_classification import is_pep
-from transformers import pipeline
+from entity_extraction import merge_entities, run_ner_batch
+from entity_classification import classify_entities
+from entity_enrichment import query_gleif_batch, map_iso3166_country
+from pep_classification import is_pep_batch
+from model_workers import map_shards
 
-def process_transaction(transaction):
+def parse_transaction(transaction):
+    """Pull the transaction ID, sender, receiver and free text out of a transaction."""
     if isinstance(transaction, dict):
         txn_id = transaction.get("Transaction ID", "Unknown")
         sender = transaction.get("Payer Name") or transaction.get("Sender Name")
@@ -23,34 +24,74 @@ def process_transaction(transaction):
         txn_id = txn_match.group(1) if txn_match else "Unknown"
         sender = payer_match.group(1) if payer_match else None
         receiver = receiver_match.group(1) if receiver_match else None
-    
-    # --- Run NER on the unstructured text ---
-    ner = pipeline("ner", model="dslim/bert-base-NER", aggregation_strategy="max")
-    ner_unstructured = ner(raw_text)
-    unstructured_entities = merge_entities(ner_unstructured)
-
-    # --- Run NER on sender and receiver separately ---
-    sender_entity = None
-    if sender:
-        ner_sender = ner(sender)
-        if isinstance(ner_sender, list) and ner_sender:
-            tag = ner_sender[0].get('entity_group')
-            if tag not in ['ORG', 'PER']:
-                tag = 'ORG'
-            sender_entity = (sender, tag)
-        else:
-            sender_entity = (sender, "ORG")
-
-    receiver_entity = None
-    if receiver:
-        ner_receiver = ner(receiver)
-        if isinstance(ner_receiver, list) and ner_receiver:
-            tag = ner_receiver[0].get('entity_group')
-            if tag not in ['ORG', 'PER']:
-                tag = 'ORG'
-            receiver_entity = (receiver, tag)
-        else:
-            receiver_entity = (receiver, "ORG")
+    return txn_id, sender, receiver, raw_text
+
+def parse_amount(transaction):
+    """Transaction amount as a float ("$1,000,000" -> 1000000.0), or None when it is missing."""
+    if isinstance(transaction, dict):
+        amount = transaction.get("Amount")
+        if isinstance(amount, (int, float)):
+            return float(amount)
+    else:
+        amount_match = re.search(r"\"?Amount\"?\s*:\s*\"?([^\"\n]+)", transaction)
+        amount = amount_match.group(1) if amount_match else None
+    number_match = re.search(r"\d[\d,]*(?:\.\d+)?", amount or "")
+    return float(number_match.group(0).replace(",", "")) if number_match else None
+
+def tag_structured_entity(name, ner_result):
+    """Tag a sender/receiver name as ORG or PER from its NER result, defaulting to ORG."""
+    if isinstance(ner_result, list) and ner_result:
+        tag = ner_result[0].get('entity_group')
+        if tag not in ['ORG', 'PER']:
+            tag = 'ORG'
+        return (name, tag)
+    return (name, "ORG")
+
+def process_transactions(transactions):
+    """Process many transactions, running NER for all of them in shared padded batches."""
+    parsed = [parse_transaction(transaction) for transaction in transactions]
+
+    texts = []
+    for _, sender, receiver, raw_text in parsed:
+        texts.extend([raw_text, sender, receiver])
+    ner_results = {}
+    # Spread over the model workers, when running with them
+    for shard_results in map_shards(run_ner_batch, dict.fromkeys(text for text in texts if text and text.strip())):
+        ner_results.update(shard_results)
+
+    entities_per_transaction = [
+        _combine_entities(sender, receiver, raw_text, ner_results)
+        for _, sender, receiver, raw_text in parsed
+    ]
+
+    # Zero-shot classification for every ORG of the batch in one call
+    org_names = list(dict.fromkeys(
+        name for entities in entities_per_transaction for name, tag in entities if tag == "ORG"
+    ))
+    classifications = [classification for shard in map_shards(classify_entities, org_names) for classification in shard]
+    org_classifications = dict(zip(org_names, classifications))
+    org_gleif_data = query_gleif_batch(org_names)
+    per_names = [name for entities in entities_per_transaction for name, tag in entities if tag == "PER"]
+    pep_status = is_pep_batch(per_names)
+
+    results = [
+        _build_result(txn_id, entities, org_classifications, org_gleif_data, pep_status)
+        for (txn_id, _, _, _), entities in zip(parsed, entities_per_transaction)
+    ]
+    for result, transaction in zip(results, transactions):
+        result["Transaction Amount"] = parse_amount(transaction)
+    return results
+
+def process_transaction(transaction):
+    return process_transactions([transaction])[0]
+
+def _combine_entities(sender, receiver, raw_text, ner_results):
+    # --- NER on the unstructured text ---
+    unstructured_entities = merge_entities(ner_results.get(raw_text, []))
+
+    # --- NER on sender and receiver separately ---
+    sender_entity = tag_structured_entity(sender, ner_results.get(sender)) if sender else None
+    receiver_entity = tag_structured_entity(receiver, ner_results.get(receiver)) if receiver else None
 
     # --- Combine structured (sender, receiver) and unstructured entities ---
     combined_entities = []
@@ -63,12 +104,9 @@ def process_transaction(transaction):
             combined_entities.append(ent)
 
     # Deduplicate based on (name, tag)
-    combined_entities = list({(name, tag) for name, tag in combined_entities})
-
-    # --- Separate entities by NER tag ---
-    per_entities = [name for name, tag in combined_entities if tag == "PER"]
-    org_entities = [name for name, tag in combined_entities if tag == "ORG"]
+    return list({(name, tag) for name, tag in combined_entities})
 
+def _build_result(txn_id, combined_entities, org_classifications, org_gleif_data, pep_status):
     # --- Classify all entities and calculate overall confidence ---
     classified_entities, countries = [], []
     total_score = 0.0
@@ -82,8 +120,8 @@ def process_transaction(transaction):
     }
     for name, tag in combined_entities:
         if tag == 'ORG':
-            classification = classify_entity(name)
-            sender_gleif_data = query_gleif(name)
+            classification = org_classifications[name]
+            sender_gleif_data = org_gleif_data.get(name, {})
             countrycode = sender_gleif_data.get("attributes", {}).get("entity", {}).get("legalAddress", {}).get("country", "Unknown")
             if countrycode in CUSTOM_COUNTRY_MAPPING:
                 country = CUSTOM_COUNTRY_MAPPING[countrycode]
@@ -94,7 +132,7 @@ def process_transaction(transaction):
         if tag == 'PER':
             entity_type = 'Individual'
             evidence = None
-            if is_pep(name):
+            if pep_status.get(name):
                 entity_type = 'PEP'
                 evidence = 'OpenSanctions'
             classification = {
@@ -1,17 +1,272 @@
 import os
+import csv
 import json
+import threading
+import xml.etree.ElementTree as ET
 import requests
 from dotenv import load_dotenv
+from fuzzywuzzy import fuzz
+from llm_backend import generate
+from name_index import NameIndex, normalize_name, sorted_tokens_key, phonetic_key
+import name_vectors
 
 # Load API keys
 load_dotenv()
-HF_API_KEY = os.getenv("HUGGING_FACE_API_KEY") 
 OFAC_API_KEY = os.getenv("OFAC_API_KEY")  
 OPENSANCTIONS_API_KEY = os.getenv("OPENSANCTIONS_API_KEY")  
 
 OFAC_API_URL = "https://api.ofac-api.com/v4/screen"
 OPENSANCTIONS_API_URL = "https://api.opensanctions.org/match/sanctions"
-HF_API_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.1"
+# Generated-token cap for the LLM write-up (replaces the old max_length, which also counted the prompt)
+SANCTIONS_ANALYSIS_MAX_NEW_TOKENS = int(os.getenv("SANCTIONS_ANALYSIS_MAX_NEW_TOKENS", "768"))
+
+# Directory holding the list exports for local screening (sdn.csv + alt.csv, consolidated.xml,
+# the EU financial sanctions CSV, the SECO XML); the remote APIs are used when it is not set
+SANCTIONS_LISTS_DIR = os.getenv("SANCTIONS_LISTS_DIR")
+SANCTIONS_MIN_SCORE = int(os.getenv("SANCTIONS_MIN_SCORE", "95"))
+root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+# Saved records, name keys and TF-IDF name vectors; rebuilt only when the list files change
+SANCTIONS_VECTOR_INDEX_DIR = os.getenv("SANCTIONS_VECTOR_INDEX_DIR", os.path.join(root_dir, ".cache", "sanctions_vectors"))
+
+# === Local sanctions list loaders ===
+# Each loader yields records {"id", "name", "names", "type", "source", "programs"},
+# where type is "person" or "organization".
+
+def load_ofac_sdn(directory):
+    """OFAC SDN list: sdn.csv (primary names) and alt.csv (aliases), both without header rows."""
+    sdn_path = os.path.join(directory, "sdn.csv")
+    if not os.path.exists(sdn_path):
+        return
+    aliases = {}
+    alt_path = os.path.join(directory, "alt.csv")
+    if os.path.exists(alt_path):
+        with open(alt_path, "r", encoding="latin-1", newline="") as file:
+            for row in csv.reader(file):
+                if len(row) > 3:
+                    aliases.setdefault(row[0], []).append(row[3])
+    with open(sdn_path, "r", encoding="latin-1", newline="") as file:
+        for row in csv.reader(file):
+            if len(row) < 4 or row[2] in ("vessel", "aircraft"):
+                continue
+            ent_num, name, sdn_type, program = row[0], row[1], row[2], row[3]
+            yield {
+                "id": f"ofac-{ent_num}",
+                "name": name,
+                "names": [name] + aliases.get(ent_num, []),
+                "type": "person" if sdn_type == "individual" else "organization",
+                "source": "OFAC",
+                "programs": [p.strip("[] ") for p in program.split("] [") if p.strip("[] -0")],
+            }
+
+def load_un_consolidated(directory):
+    """UN Security Council consolidated list (consolidated.xml)."""
+    path = os.path.join(directory, "consolidated.xml")
+    if not os.path.exists(path):
+        return
+    root = ET.parse(path).getroot()
+    for tag, entity_type, alias_tag in (("INDIVIDUAL", "person", "INDIVIDUAL_ALIAS"), ("ENTITY", "organization", "ENTITY_ALIAS")):
+        for node in root.iter(tag):
+            name_parts = [node.findtext(part) for part in ("FIRST_NAME", "SECOND_NAME", "THIRD_NAME", "FOURTH_NAME")]
+            name = " ".join(part.strip() for part in name_parts if part and part.strip())
+            names = [name] + [alias.findtext("ALIAS_NAME") for alias in node.iter(alias_tag) if alias.findtext("ALIAS_NAME")]
+            yield {
+                "id": f"un-{node.findtext('DATAID')}",
+                "name": name,
+                "names": names,
+                "type": entity_type,
+                "source": "UN",
+                "programs": [node.findtext("UN_LIST_TYPE") or ""],
+            }
+
+def load_eu_consolidated(directory):
+    """EU consolidated financial sanctions list, CSV export (eu_sanctions.csv, ';'-separated)."""
+    path = os.path.join(directory, "eu_sanctions.csv")
+    if not os.path.exists(path):
+        return
+    records = {}
+    with open(path, "r", encoding="utf-8-sig", newline="") as file:
+        reader = csv.DictReader(file, delimiter=";")
+        columns = reader.fieldnames or []
+        id_column = next((c for c in columns if c.endswith("LogicalId") and c.startswith("Entity")), None)
+        name_column = next((c for c in columns if "WholeName" in c), None)
+        type_column = next((c for c in columns if "SubjectType" in c and "Code" in c), None) or \
+            next((c for c in columns if "SubjectType" in c), None)
+        programme_column = next((c for c in columns if "Programme" in c), None)
+        if not id_column or not name_column:
+            print(f"Unrecognised EU sanctions CSV layout: {path}")
+            return
+        for row in reader:
+            name = (row.get(name_column) or "").strip()
+            if not name:
+                continue
+            record = records.setdefault(row[id_column], {
+                "id": f"eu-{row[id_column]}",
+                "name": name,
+                "names": [],
+                "type": "person" if (row.get(type_column) or "").lower() in ("person", "p") else "organization",
+                "source": "EU",
+                "programs": [row.get(programme_column) or ""] if programme_column else [],
+            })
+            record["names"].append(name)
+    yield from records.values()
+
+def load_seco(directory):
+    """Swiss SECO consolidated list (seco.xml)."""
+    path = os.path.join(directory, "seco.xml")
+    if not os.path.exists(path):
+        return
+    root = ET.parse(path).getroot()
+    for target in root.iter("target"):
+        subject = next((child for child in target if child.tag in ("individual", "entity")), None)
+        if subject is None:
+            continue
+        names = []
+        for name_node in subject.iter("name"):
+            parts = [value.text.strip() for part in name_node.iter("name-part") for value in part.iter("value") if value.text]
+            if parts:
+                names.append(" ".join(parts))
+        if not names:
+            continue
+        yield {
+            "id": f"seco-{target.get('ssid')}",
+            "name": names[0],
+            "names": names,
+            "type": "person" if subject.tag == "individual" else "organization",
+            "source": "SECO",
+            "programs": [target.get("sanctions-set-id") or ""],
+        }
+
+SANCTIONS_LOADERS = [load_ofac_sdn, load_un_consolidated, load_eu_consolidated, load_seco]
+# Files the loaders read; a saved index is reused while none of them has changed
+SANCTIONS_LIST_FILES = ["sdn.csv", "alt.csv", "consolidated.xml", "eu_sanctions.csv", "seco.xml"]
+
+# === Local screening engine ===
+
+class SanctionsIndex:
+    """In-memory sanctions name index.
+
+    Candidates come from exact normalized names, word-order independent forms,
+    phonetic (Soundex) keys, character trigrams and, when attached, a TF-IDF
+    vector index; each candidate is then scored 0-100 with a token-sort fuzzy
+    ratio, the same scale as the APIs' minScore.
+    """
+
+    def __init__(self, records, vectors=None):
+        self.records = list(records)
+        self.entries = []  # (record index, normalized name)
+        self.keys = {}
+        for record_index, record in enumerate(self.records):
+            for name in dict.fromkeys(record["names"]):
+                normalized = normalize_name(name)
+                if not normalized:
+                    continue
+                entry = len(self.entries)
+                self.entries.append((record_index, normalized))
+                for key in (normalized, sorted_tokens_key(normalized), "~" + phonetic_key(normalized)):
+                    self.keys.setdefault(key, []).append(entry)
+        self.trigrams = NameIndex([normalized for _, normalized in self.entries])
+        self.vectors = vectors
+
+    def normalized_names(self):
+        return [normalized for _, normalized in self.entries]
+
+    def __getstate__(self):
+        # The vectors are saved as their own memory-mapped .npy files
+        state = self.__dict__.copy()
+        state["vectors"] = None
+        return state
+
+    @classmethod
+    def load_or_build(cls, lists_dir, index_dir=None):
+        """Load the index saved in `index_dir` while the list files are unchanged, else parse the lists and save it."""
+        def build():
+            records = [record for loader in SANCTIONS_LOADERS for record in loader(lists_dir)]
+            print(f"Loaded {len(records)} sanctioned parties from {lists_dir}")
+            index = cls(records)
+            return index, index.normalized_names()
+
+        paths = [os.path.join(lists_dir, name) for name in SANCTIONS_LIST_FILES]
+        index, vectors = name_vectors.load_or_build(index_dir, name_vectors.source_fingerprint(paths, "sanctions-index-1"), build)
+        index.vectors = vectors
+        return index
+
+    def screen_batch(self, cases, min_score=SANCTIONS_MIN_SCORE, limit=5):
+        """Screen many {"name", "type"} cases, with one vector search for all of them."""
+        names = [normalize_name(case["name"]) for case in cases]
+        if self.vectors is not None:
+            vector_candidates = self.vectors.query(names, k=20, min_similarity=0.3)
+        else:
+            vector_candidates = [[] for _ in names]
+        return [
+            self.screen(case["name"], case["type"].lower(), min_score, limit, [entry for entry, _ in candidates])
+            for case, candidates in zip(cases, vector_candidates)
+        ]
+
+    def screen(self, name, entity_type=None, min_score=SANCTIONS_MIN_SCORE, limit=5, extra_candidates=()):
+        normalized = normalize_name(name)
+        if not normalized:
+            return []
+        candidates = set(self.trigrams.candidates(normalized, limit=20))
+        candidates.update(extra_candidates)
+        for key in (normalized, sorted_tokens_key(normalized), "~" + phonetic_key(normalized)):
+            candidates.update(self.keys.get(key, []))
+
+        best = {}
+        for entry in candidates:
+            record_index, candidate = self.entries[entry]
+            record = self.records[record_index]
+            if entity_type and record["type"] != entity_type:
+                continue
+            score = fuzz.token_sort_ratio(normalized, candidate, force_ascii=False, full_process=False)
+            if score >= min_score and score > best.get(record_index, (0, None))[0]:
+                best[record_index] = (score, candidate)
+
+        matches = []
+        for record_index, (score, matched_name) in sorted(best.items(), key=lambda item: -item[1][0])[:limit]:
+            record = self.records[record_index]
+            matches.append({
+                "id": record["id"],
+                "name": record["name"],
+                "matchedName": matched_name,
+                "score": score,
+                "source": record["source"],
+                "programs": record["programs"],
+                "type": record["type"],
+            })
+        return matches
+
+_sanctions_index = None
+_sanctions_index_lock = threading.Lock()
+
+def get_sanctions_index():
+    """Return the local sanctions index, or None when SANCTIONS_LISTS_DIR is not configured."""
+    global _sanctions_index
+    if not SANCTIONS_LISTS_DIR:
+        return None
+    if _sanctions_index is None:
+        with _sanctions_index_lock:
+            if _sanctions_index is None:
+                _sanctions_index = SanctionsIndex.load_or_build(SANCTIONS_LISTS_DIR, SANCTIONS_VECTOR_INDEX_DIR)
+    return _sanctions_index
+
+def screen_entities_local(cases, index=None):
+    """Screen cases against the local lists.
+
+    Returns (ofac_like, open_sanctions_like) responses, shaped like the two remote
+    screenings so summarize_sanctions_data and everything after it is unchanged.
+    """
+    index = index or get_sanctions_index()
+    ofac_cases = []
+    open_sanctions = {}
+    for case, matches in zip(cases, index.screen_batch(cases)):
+        ofac_cases.append({
+            "name": case["name"],
+            "riskLevel": "High" if matches else "None",
+            "sanctioningBodies": sorted({match["source"] for match in matches}) or "N/A",
+            "matches": matches,
+        })
+        open_sanctions[case["name"]] = matches
+    return {"cases": ofac_cases}, open_sanctions
 
 def screen_entities_ofac(cases):
     payload = {
@@ -67,7 +322,7 @@ def summarize_sanctions_data(ofac_response, open_sanctions_response):
 
     if open_sanctions_response:
         summary["OpenSanctions"] = [
-            {"Entity": name, "Matches": len(matches)}
+            {"Entity": name, "Matches": sum(1 for match in matches if is_sanctions_match(match))}
             for name, matches in open_sanctions_response.items()
         ]
     
@@ -96,38 +351,51 @@ def risk_analysis_huggingface(ofac_response, open_sanctions_response):
         {summarized_data}\n### Analysis:
         """
         
-        headers = {
-            "Authorization": f"Bearer {HF_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "inputs": prompt,
-            "parameters": {"max_length": 2048, "temperature": 0.5},
-            "options": {
-                "return_full_text": False  # Only return the generated output
-            }
-        }
-
-        response = requests.post(HF_API_URL, headers=headers, json=payload)
-
-        print(response)
-
-        if response.status_code == 200:
-            generated_text = response.json()[0]["generated_text"]
-            # Attempt to remove anything before the separator:
-            if "### Analysis:" in generated_text:
-                return generated_text.split("### Analysis:")[-1].strip()
-            else:
-                return generated_text.strip()
+        generated_text = generate(prompt, max_new_tokens=SANCTIONS_ANALYSIS_MAX_NEW_TOKENS)
+        if "### Analysis:" in generated_text:
+            return generated_text.split("### Analysis:")[-1].strip()
         else:
-            return f"Error in risk_analysis_huggingface: {response.status_code} - {response.text}"
-    
+            return generated_text.strip()
+
     except Exception as e:
         return f"Error in risk_analysis_huggingface: {e}"
 
-def getSanctionReports(cases):
-    screening_result_from_ofac = screen_entities_ofac(cases)
-    screening_result_from_openSanctionsAPI = screen_entities_openSanctionsAPI(cases)
+def screen_entities(cases):
+    """Screen cases locally when the lists are available, else through the OFAC and OpenSanctions APIs."""
+    if get_sanctions_index() is not None:
+        return screen_entities_local(cases)
+    return screen_entities_ofac(cases), screen_entities_openSanctionsAPI(cases)
+
+def is_sanctions_match(match):
+    """True for a local match, or an OpenSanctions candidate it marks as a match or scores at SANCTIONS_MIN_SCORE or above."""
+    if match.get("match"):
+        return True
+    # OpenSanctions scores are 0-1, local ones 0-100 like SANCTIONS_MIN_SCORE
+    score = match.get("score") or 0
+    return (score * 100 if score <= 1 else score) >= SANCTIONS_MIN_SCORE
+
+def sanctions_hits(ofac_response, open_sanctions_response):
+    """Map each screened name to the bodies it is sanctioned by ([] when clean); None if both screenings failed."""
+    if ofac_response is None and open_sanctions_response is None:
+        return None
+    hits = {}
+    for case in (ofac_response or {}).get("cases", []):
+        bodies = hits.setdefault(case.get("name"), [])
+        if case.get("riskLevel") not in (None, "None", "Unknown"):
+            sanctioned_by = case.get("sanctioningBodies")
+            bodies.extend(sanctioned_by if isinstance(sanctioned_by, list) else ["OFAC"])
+    for name, matches in (open_sanctions_response or {}).items():
+        bodies = hits.setdefault(name, [])
+        # The /match endpoint also returns weak candidates, flagged "match": false
+        for match in filter(is_sanctions_match, matches):
+            source = match.get("source", "OpenSanctions")
+            if source not in bodies:
+                bodies.append(source)
+    return {name: sorted(set(bodies)) for name, bodies in hits.items()}
+
+def getSanctionReports(cases, screening=None):
+    """LLM sanctions analysis; `screening` reuses an (ofac, open_sanctions) result from screen_entities."""
+    screening_result_from_ofac, screening_result_from_openSanctionsAPI = screening or screen_entities(cases)
     return risk_analysis_huggingface(screening_result_from_ofac, screening_result_from_openSanctionsAPI)
 
 if __name__ == "__main__":
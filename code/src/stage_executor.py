@@ -0,0 +1,79 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# Shared by all transactions; a timed-out stage keeps its thread until it returns, so leave headroom
+STAGE_WORKERS = int(os.getenv("STAGE_WORKERS", "16"))
+
+# While a submitted stage still waits for a free thread, check this often whether it has started
+STAGE_START_POLL_INTERVAL = 0.05
+
+_executor = ThreadPoolExecutor(max_workers=STAGE_WORKERS, thread_name_prefix="stage")
+
+class Stage:
+    """One pipeline step: `fn` is called with the results of `depends_on` (in that order).
+
+    If it raises, or has not finished `timeout` seconds after it started running, its result is `default`.
+    Time spent waiting for a free executor thread does not count.
+    """
+
+    def __init__(self, name, fn, timeout, default=None, depends_on=()):
+        self.name = name
+        self.fn = fn
+        self.timeout = timeout
+        self.default = default
+        self.depends_on = tuple(depends_on)
+
+def run_stages(stages, executor=None, progress=None):
+    """Run a DAG of stages, each as soon as its dependencies are done; returns a dict of name -> result.
+
+    `progress`, if given, is called with (stage name, "done" | "failed" | "timed_out" | "skipped").
+    """
+    def report(name, status):
+        if progress is not None:
+            progress(name, status)
+
+    def timed(stage, *args):
+        # Runs on the executor thread, so a stage queued behind other transactions' stages is not timed out unstarted
+        started_at[stage.name] = time.monotonic()
+        return stage.fn(*args)
+
+    executor = executor or _executor
+    pending = {stage.name: stage for stage in stages}
+    results, running, started_at = {}, {}, {}
+
+    while pending or running:
+        for name, stage in list(pending.items()):
+            if all(dependency in results for dependency in stage.depends_on):
+                del pending[name]
+                running[executor.submit(timed, stage, *(results[dependency] for dependency in stage.depends_on))] = stage
+        if not running:
+            # Only stages whose dependencies will never finish are left
+            for name, stage in pending.items():
+                print(f"Stage '{name}' has unmet dependencies {stage.depends_on}; using its default")
+                results[name] = stage.default
+                report(name, "skipped")
+            break
+
+        deadlines = [started_at[stage.name] + stage.timeout for stage in running.values() if stage.name in started_at]
+        if len(deadlines) < len(running):
+            deadlines.append(time.monotonic() + STAGE_START_POLL_INTERVAL)
+        done, _ = wait(running, timeout=max(0.0, min(deadlines) - time.monotonic()), return_when=FIRST_COMPLETED)
+        for future in done:
+            stage = running.pop(future)
+            try:
+                results[stage.name] = future.result()
+                report(stage.name, "done")
+            except Exception as e:
+                print(f"Stage '{stage.name}' failed: {e}; using its default")
+                results[stage.name] = stage.default
+                report(stage.name, "failed")
+
+        now = time.monotonic()
+        for future, stage in list(running.items()):
+            if stage.name in started_at and now >= started_at[stage.name] + stage.timeout:
+                print(f"Stage '{stage.name}' timed out after {stage.timeout}s; using its default")
+                del running[future]
+                results[stage.name] = stage.default
+                report(stage.name, "timed_out")
+    return results
@@ -0,0 +1,112 @@
+import os
+import io
+import csv
+import json
+from itertools import islice
+
+READ_CHUNK_SIZE = 1 << 16
+_decoder = json.JSONDecoder()
+# Between top-level values: whitespace, the commas of "{...},{...}" input and the brackets of a JSON array
+_SEPARATORS = " \t\r\n,[]"
+_NUMBER_CHARS = "0123456789+-.eE"
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def iter_json_values(file, chunk_size=READ_CHUNK_SIZE):
+    """Yield the objects of a JSON array, JSON lines or comma-separated objects, reading `file` in chunks.
+
+    Only the object being decoded is held in memory, so arbitrarily large arrays stream.
+    """
+    buffer, position, eof = "", 0, False
+    while True:
+        while position < len(buffer) and buffer[position] in _SEPARATORS:
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = file.read(chunk_size), 0
+            eof = not buffer
+            continue
+        try:
+            value, end = _decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            # The value continues past the buffered text
+            chunk = file.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        if _is_number(value) and not eof and (end == len(buffer) or buffer[end] in _NUMBER_CHARS):
+            # A number cut by the chunk boundary decodes, but short ("12" of "12345", "3" of "3.25"); decode it again with more text
+            chunk = file.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        yield value
+        position = end
+
+def iter_transactions(path):
+    """Stream transactions from a JSON (object or array), JSON lines or CSV file."""
+    with open(path, "r", encoding="utf-8", newline="") as file:
+        if os.path.splitext(path)[1].lower() == ".csv":
+            yield from csv.DictReader(file)
+        else:
+            yield from iter_json_values(file)
+
+def iter_transactions_from_text(text):
+    return iter_json_values(io.StringIO(text))
+
+def chunked(iterable, size):
+    """Yield lists of up to `size` items."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+class ResultWriter:
+    """Append-only JSON lines writer; every record is flushed as soon as it is written.
+
+    With `append=False` the file is started afresh. `fsync=True` also survives an OS crash.
+    """
+
+    def __init__(self, path, append=False, fsync=False):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.file = open(path, "a" if append else "w", encoding="utf-8")
+        self.fsync = fsync
+        if append and self.file.tell() > 0:
+            with open(path, "rb") as existing:
+                existing.seek(-1, os.SEEK_END)
+                if existing.read(1) != b"\n":
+                    # End the line a crash cut short, so the next record starts on a line of its own
+                    self.file.write("\n")
+
+    def write(self, record):
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def iter_results(path):
+    """Read back a JSON lines result file; a line cut short by a crash is skipped."""
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                print(f"Skipping incomplete result line in {path}")
+
+def count_results(path):
+    """Number of complete results in a result file; results are written in input order, so an interrupted run resumes after them."""
+    if not os.path.exists(path):
+        return 0
+    return sum(1 for _ in iter_results(path))
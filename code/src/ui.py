@@ -3,20 +3,26 @@ import json
 import ollama
 import os
 import torch
+from collections import deque
 
-from main import app 
+from main import app, RESULT_PATH
+from model_workers import start_models
+from transaction_io import iter_results
 from voice import text_to_speech
 torch.classes.__path__ = []
+# Streamlit reruns this script on every interaction; workers and loaded models are only set up once per process
+start_models()
 
 root_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), "..",".."))
-data_file = os.path.join(root_dir, "datasets", "result.json")  
+data_file = RESULT_PATH
+# The result file keeps every run; the chatbot gets the most recent results as context
+CHAT_CONTEXT_RESULTS = int(os.getenv("CHAT_CONTEXT_RESULTS", "20"))
 
 def load_risk_data():
     try:
         if not os.path.exists(data_file):
-            raise FileNotFoundError("result.json file not found.")
-        with open(data_file, "r", encoding="utf-8") as file:
-            return json.load(file)
+            raise FileNotFoundError("result.jsonl file not found.")
+        return list(deque(iter_results(data_file), maxlen=CHAT_CONTEXT_RESULTS))
     except (FileNotFoundError, json.JSONDecodeError):
         return {"error": "Please enter input transaction data."}
 
@@ -108,7 +114,7 @@ if st.button("Analyze Transaction 🚀"):
             except json.JSONDecodeError:
                 transaction_text = transaction_input 
 
-            justification = app(transaction_text)
+            justification = list(app(transaction_text))
 
             st.markdown("<h2>Risk Analysis Result</h2>", unsafe_allow_html=True)
             
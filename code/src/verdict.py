@@ -1,194 +1,301 @@
 import os
+import re
 import json
-import requests
+import numpy as np
 from dotenv import load_dotenv
+from llm_backend import generate, truncate_to_tokens
 
 # Load API keys
 load_dotenv()
-HF_API_KEY = os.getenv("HUGGING_FACE_API_KEY") 
 OFAC_API_KEY = os.getenv("OFAC_API_KEY")  
 OPENSANCTIONS_API_KEY = os.getenv("OPENSANCTIONS_API_KEY")  
 
 OFAC_API_URL = "https://api.ofac-api.com/v4/screen"
 OPENSANCTIONS_API_URL = "https://api.opensanctions.org/match/sanctions"
-HF_API_URL = "https://api-inference.huggingface.co/models/mistralai/Mistral-7B-Instruct-v0.1"
-
-
-
-def verdict(extraction_result):
-    try:
-
-        prompt = f"""
-        AI-Driven Transaction Risk Analysis System
-        Role & Objective
-        You are a financial risk analyst specializing in forensic transaction analysis. Your task is to assess the risk level of a given transaction by evaluating multiple factors, identifying potential fraud, and providing a well-reasoned justification for the risk score. The transaction details include multiple entities, transaction amounts, and additional metadata from various risk intelligence sources.
-
-        Objective
-        Analyze the provided transaction data and determine whether it poses a financial, legal, or compliance risk. Consider all available information, detect hidden patterns, and justify your findings using data-driven reasoning. Your output should include both a numerical risk score and a detailed textual justification explaining how the score was derived.
-
-        Data Sources & Their Importance
-        You have access to the following risk intelligence sources:
-
-        Sanctions & Watchlists (OFAC, OpenSanctions, FATF)
-
-        Verify if any entity is on sanctions lists and assess the severity of sanctions.
-
-        Consider sanctioning bodies such as the UN, EU, US Treasury, and World Bank.
-
-        Identify reasons for sanctions such as money laundering, terrorism, or fraud.
-
-        News & Media Sentiment (Google News API)
-
-        Identify negative press coverage related to fraud, lawsuits, or regulatory violations.
-
-        Assess the credibility of sources and consider the recency and frequency of reports.
-
-        Entity Classification (OpenCorporates, SEC EDGAR, Offshore Trusts API)
-
-        Categorize entities as Corporations, Shell Companies, Non-Profits, Financial Institutions, or Politically Exposed Persons (PEPs).
-
-        Identify high-risk entity types such as shell companies or offshore trusts.
-
-        Sector Correlation Analysis
-
-        Determine if the transaction sectors are logically related.
-
-        Flag transactions where sectors appear unrelated or unusual.
-
-        Geopolitical & Cross-Border Risk (FATF, AML Risk Index, Country Risk Ratings)
-
-        Assess risk based on country connections, including high-risk jurisdictions.
-
-        Consider FATF warnings and AML (Anti-Money Laundering) index scores.
-
-        Transaction Amount Risk
-
-        Evaluate if the transaction amount is unusually high for the entities involved.
-
-        Adjust risk weight based on entity type and past transaction patterns.
-
-        Risk Scoring Model
-        Use a weighted scoring system to assign a final risk score. While you do not need to use an exact formula, consider the following approach:
-        entity_risk_score =  
-        (sanctions_risk * 0.3) +  
-        (news_risk * 0.2) +  
-        (entity_type_risk * 0.15) +  
-        (sector_mismatch_risk * 0.1) +  
-        (geopolitical_risk * 0.15) +  
-        (transaction_amount_risk * 0.1)
-        Where:
-
-        Sanctions Risk is higher for entities under major sanctions.
-
-        News Risk is based on negative news reports.
-
-        Entity Type Risk assigns higher risk to shell companies and PEPs.
-
-        Sector Mismatch Risk increases if the involved sectors are unrelated.
-
-        Geopolitical Risk considers country-based AML and FATF risk scores.
-
-        Transaction Amount Risk adjusts for unusually large transactions.
-
-        If confidence scores for individual risk factors are provided, incorporate them into the risk calculation.
-
-        Response Format
-        Sanction Analysis
-        Entity Name: [Extracted Entity]
-
-        Risk Score (0-1): [Calculated Risk Score]
-
-        Justification & Evidence:
-
-        Sanctioning Bodies: [OFAC, FATF, etc.]
-
-        Reason for Sanctions: [Terrorism, fraud, etc.]
-
-        Historical Violations: [List of past incidents]
-
-        Connections to Other Risky Entities: [If applicable]
-
-        Entity-Specific Risk
-        Entity Name: [Extracted Entity]
-
-        Risk Score (0-1): [Calculated Risk Score]
-
-        Justification:
-
-        Negative News Sentiment: [Mention major cases]
-
-        Classification: [Shell Company / Non-Profit / PEP]
-
-        Sector Mismatch: [Related or unrelated sectors]
-
-        Geopolitical Risks: [FATF, AML, Cross-border issues]
-
-        Overall Risk Score for the transaction is
-        Final Risk Level (0-1): [Weighted Score]
-        Confidence Level (0-1): [How sure you are]
-
-        Final Justification:
-
-        Explain how all factors contribute to the risk score.
-
-        Highlight any hidden patterns or anomalies.
-
-        Summarize if the transaction should be flagged or cleared.
-
-        Textual Justification Requirement
-        Every risk score assigned must be accompanied by a clear and detailed textual justification explaining:
-
-        Why the entity or transaction is considered risky or safe
-
-        What specific data points contributed to the score
-
-        How different factors influenced the final risk assessment
-
-        Any hidden relationships or anomalies that were identified
-
-        Ensure that the textual justification is comprehensive, well-structured, and explains the reasoning behind each risk assessment in a professional and analytical manner.
-
-        Final Instructions
-        Think like a forensic financial investigator.
-
-        Justify every risk score with supporting evidence.
-
-        Identify hidden relationships between entities.
-
-        Assign sensible weights to risk factors.
-
-        Ensure no fraudulent transaction goes undetected. 
-
-        Analyse the below JSON data based on the above rules:
-        {json.dumps(extraction_result, indent=2)}
-
-        Provide your analysis in clear, concise, and professional language.
-        ### Analysis:
-        """
-
-        headers = {
-            "Authorization": f"Bearer {HF_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "inputs": prompt,
-            "parameters": {"max_length": 30000, "temperature": 0.5},
-            "options": {"return_full_text": False}
+# Generated-token cap for the LLM write-up (replaces the old max_length, which also counted the prompt)
+VERDICT_MAX_NEW_TOKENS = int(os.getenv("VERDICT_MAX_NEW_TOKENS", "1024"))
+
+# === Rule-based scoring ===
+# Weights and thresholds of the scoring model described to the LLM (see implementation_details in main.py)
+RISK_WEIGHTS = {
+    "Sanctions": 0.3,
+    "News": 0.2,
+    "Entity Type": 0.15,
+    "Sector Mismatch": 0.1,
+    "Geopolitical": 0.15,
+    "Transaction Amount": 0.1,
+}
+HIGH_RISK_THRESHOLD = 0.65
+MEDIUM_RISK_THRESHOLD = 0.4
+# Below this confidence a low-risk verdict is still sent to the LLM
+VERDICT_MIN_CONFIDENCE = float(os.getenv("VERDICT_MIN_CONFIDENCE", "0.6"))
+
+ENTITY_TYPE_RISK = {
+    "Shell Company": 1.0,
+    "PEP": 0.9,
+    "Non-Profit": 0.4,
+    "Individual": 0.3,
+    "Corporation": 0.2,
+    "Government Agency": 0.1,
+}
+UNKNOWN_ENTITY_TYPE_RISK = 0.5
+# Breakpoints follow the low/medium/high amount membership functions in probabilistic_risk_calc
+AMOUNT_RISK_POINTS = ([0, 3000, 9000, 20000], [0.0, 0.2, 0.5, 1.0])
+SECTOR_STOPWORDS = {"and", "the", "for", "services", "misc", "nec", "other", "except"}
+
+def sanctions_risk(extraction_result):
+    hits = extraction_result.get("Sanction Screening")
+    if hits is None:
+        return 0.0, False, "Sanctions screening unavailable"
+    sanctioned = {name: bodies for name, bodies in hits.items() if bodies}
+    if not sanctioned:
+        return 0.0, True, "No sanctions list matches"
+    return 1.0, True, "; ".join(f"{name}: {', '.join(bodies)}" for name, bodies in sanctioned.items())
+
+def news_risk(extraction_result):
+    scores = extraction_result.get("Real Time News Analysis of Entities Involved in the transaction") or {}
+    if not scores:
+        return 0.0, False, "No news analysis"
+    company, score = max(scores.items(), key=lambda item: item[1])
+    return min(score / 100, 1.0), True, f"Highest adverse news score: {company} ({score}/100)"
+
+def entity_type_risk(extraction_result):
+    entity_types = extraction_result.get("Entity Type") or []
+    if not entity_types:
+        return 0.0, False, "No entities extracted"
+    riskiest = max(entity_types, key=lambda entity_type: ENTITY_TYPE_RISK.get(entity_type, UNKNOWN_ENTITY_TYPE_RISK))
+    return ENTITY_TYPE_RISK.get(riskiest, UNKNOWN_ENTITY_TYPE_RISK), True, f"Riskiest entity type: {riskiest}"
+
+def sector_words(sector):
+    return {word for word in re.findall(r"[a-z]+", sector.lower()) if len(word) > 2 and word not in SECTOR_STOPWORDS}
+
+def sector_mismatch_risk(extraction_result):
+    sectors = extraction_result.get("Sectors associated with Extracted Entities") or {}
+    known = [sector for sector in sectors.values() if sector and sector != "Unknown"]
+    if len(sectors) < 2:
+        return 0.0, True, "Fewer than two organizations involved"
+    if len(known) < 2:
+        return 0.0, False, "Sectors unknown"
+    pairs = [(a, b) for i, a in enumerate(known) for b in known[i + 1:]]
+    unrelated = [(a, b) for a, b in pairs if not sector_words(a) & sector_words(b)]
+    detail = "; ".join(f"{a} / {b}" for a, b in unrelated) or "Sectors are related"
+    return len(unrelated) / len(pairs), True, detail
+
+def geopolitical_risk(extraction_result):
+    geo_risk = extraction_result.get("Geo Risk Analysis Results of Entities Involved") or {}
+    score = geo_risk.get("Normalized Risk Score for all the countries involved")
+    if score is None:
+        return 0.0, False, "No geo risk analysis"
+    return min(score / 100, 1.0), True, f"Countries: {', '.join(extraction_result.get('Countries', []))}"
+
+def transaction_amount_risk(extraction_result):
+    amount = extraction_result.get("Transaction Amount")
+    if amount is None:
+        return 0.0, False, "Amount unknown"
+    return float(np.interp(amount, *AMOUNT_RISK_POINTS)), True, f"Amount: {amount:,.2f}"
+
+RISK_FACTORS = {
+    "Sanctions": sanctions_risk,
+    "News": news_risk,
+    "Entity Type": entity_type_risk,
+    "Sector Mismatch": sector_mismatch_risk,
+    "Geopolitical": geopolitical_risk,
+    "Transaction Amount": transaction_amount_risk,
+}
+
+def risk_level(score):
+    if score > HIGH_RISK_THRESHOLD:
+        return "High"
+    if score >= MEDIUM_RISK_THRESHOLD:
+        return "Medium"
+    return "Low"
+
+def rule_based_verdict(extraction_result):
+    """Weighted risk score with a per-factor breakdown, computed without the LLM."""
+    breakdown = {}
+    risk_score = 0.0
+    covered_weight = 0.0
+    for factor, evaluate in RISK_FACTORS.items():
+        score, available, detail = evaluate(extraction_result)
+        weight = RISK_WEIGHTS[factor]
+        contribution = score * weight
+        risk_score += contribution
+        covered_weight += weight if available else 0.0
+        breakdown[factor] = {
+            "Score": round(score, 3),
+            "Weight": weight,
+            "Contribution": round(contribution, 3),
+            "Data Available": available,
+            "Detail": detail,
         }
 
-        response = requests.post(HF_API_URL, headers=headers, json=payload)
+    level = risk_level(risk_score)
+    # A sanctions list match is never cleared by the other factors
+    if breakdown["Sanctions"]["Score"] > 0:
+        level = "High"
+    confidence = covered_weight / sum(RISK_WEIGHTS.values()) * extraction_result.get("Confidence Score", 1.0)
+    return {
+        "Risk Score": round(risk_score, 3),
+        "Risk Level": level,
+        "Confidence": round(confidence, 2),
+        "Risk Factors": breakdown,
+    }
 
-        if response.status_code == 200:
-            generated_text = response.json()[0]["generated_text"]
-            if "### Analysis:" in generated_text:
-                return generated_text.split("### Analysis:")[-1].strip()
-            else:
-                return generated_text.strip()
+def needs_llm_review(assessment):
+    """Only medium/high risk or low-confidence verdicts get an LLM-written justification."""
+    return assessment["Risk Level"] != "Low" or assessment["Confidence"] < VERDICT_MIN_CONFIDENCE
+
+def rule_based_justification(assessment):
+    lines = [
+        f"Risk Score: {assessment['Risk Score']} ({assessment['Risk Level']} risk), confidence {assessment['Confidence']}."
+    ]
+    for factor, details in assessment["Risk Factors"].items():
+        lines.append(f"{factor}: {details['Score']} x {details['Weight']} = {details['Contribution']} ({details['Detail']})")
+    return "\n".join(lines)
+
+def verdict(extraction_result, assessment=None):
+    """Score the transaction with the rules; only medium/high or low-confidence cases are sent to the LLM."""
+    assessment = assessment or rule_based_verdict(extraction_result)
+    if needs_llm_review(assessment):
+        justification = llm_justification(extraction_result, assessment)
+    else:
+        justification = rule_based_justification(assessment)
+    return {**assessment, "Justification": justification}
+
+# === LLM justification ===
+# Static part of the verdict prompt. It always comes first, so backends with prefix (KV) caching reuse it
+VERDICT_INSTRUCTIONS = """AI-Driven Transaction Risk Analysis System
+Role & Objective
+You are a financial risk analyst specializing in forensic transaction analysis. Your task is to assess the risk level of a given transaction by evaluating multiple factors, identifying potential fraud, and providing a well-reasoned justification for the risk score. The transaction details include multiple entities, transaction amounts, and additional metadata from various risk intelligence sources.
+Objective
+Analyze the provided transaction data and determine whether it poses a financial, legal, or compliance risk. Consider all available information, detect hidden patterns, and justify your findings using data-driven reasoning. Your output should include both a numerical risk score and a detailed textual justification explaining how the score was derived.
+Data Sources & Their Importance
+You have access to the following risk intelligence sources:
+Sanctions & Watchlists (OFAC, OpenSanctions, FATF)
+Verify if any entity is on sanctions lists and assess the severity of sanctions.
+Consider sanctioning bodies such as the UN, EU, US Treasury, and World Bank.
+Identify reasons for sanctions such as money laundering, terrorism, or fraud.
+News & Media Sentiment (Google News API)
+Identify negative press coverage related to fraud, lawsuits, or regulatory violations.
+Assess the credibility of sources and consider the recency and frequency of reports.
+Entity Classification (OpenCorporates, SEC EDGAR, Offshore Trusts API)
+Categorize entities as Corporations, Shell Companies, Non-Profits, Financial Institutions, or Politically Exposed Persons (PEPs).
+Identify high-risk entity types such as shell companies or offshore trusts.
+Sector Correlation Analysis
+Determine if the transaction sectors are logically related.
+Flag transactions where sectors appear unrelated or unusual.
+Geopolitical & Cross-Border Risk (FATF, AML Risk Index, Country Risk Ratings)
+Assess risk based on country connections, including high-risk jurisdictions.
+Consider FATF warnings and AML (Anti-Money Laundering) index scores.
+Transaction Amount Risk
+Evaluate if the transaction amount is unusually high for the entities involved.
+Adjust risk weight based on entity type and past transaction patterns.
+Risk Scoring Model
+Use a weighted scoring system to assign a final risk score. While you do not need to use an exact formula, consider the following approach:
+entity_risk_score =
+(sanctions_risk * 0.3) +
+(news_risk * 0.2) +
+(entity_type_risk * 0.15) +
+(sector_mismatch_risk * 0.1) +
+(geopolitical_risk * 0.15) +
+(transaction_amount_risk * 0.1)
+Where:
+Sanctions Risk is higher for entities under major sanctions.
+News Risk is based on negative news reports.
+Entity Type Risk assigns higher risk to shell companies and PEPs.
+Sector Mismatch Risk increases if the involved sectors are unrelated.
+Geopolitical Risk considers country-based AML and FATF risk scores.
+Transaction Amount Risk adjusts for unusually large transactions.
+If confidence scores for individual risk factors are provided, incorporate them into the risk calculation.
+Response Format
+Sanction Analysis
+Entity Name: [Extracted Entity]
+Risk Score (0-1): [Calculated Risk Score]
+Justification & Evidence:
+Sanctioning Bodies: [OFAC, FATF, etc.]
+Reason for Sanctions: [Terrorism, fraud, etc.]
+Historical Violations: [List of past incidents]
+Connections to Other Risky Entities: [If applicable]
+Entity-Specific Risk
+Entity Name: [Extracted Entity]
+Risk Score (0-1): [Calculated Risk Score]
+Justification:
+Negative News Sentiment: [Mention major cases]
+Classification: [Shell Company / Non-Profit / PEP]
+Sector Mismatch: [Related or unrelated sectors]
+Geopolitical Risks: [FATF, AML, Cross-border issues]
+Overall Risk Score for the transaction is
+Final Risk Level (0-1): [Weighted Score]
+Confidence Level (0-1): [How sure you are]
+Final Justification:
+Explain how all factors contribute to the risk score.
+Highlight any hidden patterns or anomalies.
+Summarize if the transaction should be flagged or cleared.
+Textual Justification Requirement
+Every risk score assigned must be accompanied by a clear and detailed textual justification explaining:
+Why the entity or transaction is considered risky or safe
+What specific data points contributed to the score
+How different factors influenced the final risk assessment
+Any hidden relationships or anomalies that were identified
+Ensure that the textual justification is comprehensive, well-structured, and explains the reasoning behind each risk assessment in a professional and analytical manner.
+Final Instructions
+Think like a forensic financial investigator.
+Justify every risk score with supporting evidence.
+Identify hidden relationships between entities.
+Assign sensible weights to risk factors.
+Ensure no fraudulent transaction goes undetected.
+"""
+# Token caps per prompt section, counted with the backend model's tokenizer
+VERDICT_ASSESSMENT_TOKENS = int(os.getenv("VERDICT_ASSESSMENT_TOKENS", "512"))
+VERDICT_FINDINGS_TOKENS = int(os.getenv("VERDICT_FINDINGS_TOKENS", "768"))
+VERDICT_SANCTIONS_TOKENS = int(os.getenv("VERDICT_SANCTIONS_TOKENS", "384"))
+
+def compact_json(data):
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+def compact_findings(extraction_result):
+    """The findings the rule-based assessment does not already carry, without empty or duplicated fields."""
+    geo_risk = extraction_result.get("Geo Risk Analysis Results of Entities Involved") or {}
+    findings = {
+        "Transaction ID": extraction_result.get("Transaction ID"),
+        "Entities": dict(zip(extraction_result.get("Extracted Entity", []), extraction_result.get("Entity Type", []))),
+        "Supporting Evidence": [evidence for evidence in extraction_result.get("Supporting Evidence", []) if evidence],
+        "Countries": list(dict.fromkeys(extraction_result.get("Countries", []))),
+        "Country Corridors": geo_risk.get("Detailed Breakdown of Geo Risk Analysis between countries involved"),
+        "News Risk (0-100)": extraction_result.get("Real Time News Analysis of Entities Involved in the transaction"),
+        "Sectors": extraction_result.get("Sectors associated with Extracted Entities"),
+        "Sanctions Matches": {
+            name: bodies for name, bodies in (extraction_result.get("Sanction Screening") or {}).items() if bodies
+        },
+    }
+    return {key: value for key, value in findings.items() if value}
+
+def build_verdict_prompt(extraction_result, assessment):
+    """Static instructions followed by the per-transaction sections, each capped to its token budget."""
+    sanction_analysis = extraction_result.get("Sanction Analysis")
+    sections = [
+        ("Rule-based assessment (use this score and level and explain them)", compact_json(assessment), VERDICT_ASSESSMENT_TOKENS),
+        ("Findings", compact_json(compact_findings(extraction_result)), VERDICT_FINDINGS_TOKENS),
+    ]
+    if isinstance(sanction_analysis, str) and sanction_analysis:
+        sections.append(("Sanctions analysis", sanction_analysis, VERDICT_SANCTIONS_TOKENS))
+    parts = [VERDICT_INSTRUCTIONS.rstrip()]
+    for title, text, max_tokens in sections:
+        parts.append(f"{title}:\n{truncate_to_tokens(text, max_tokens)}")
+    parts.append("Provide your analysis in clear, concise, and professional language.\n### Analysis:")
+    return "\n\n".join(parts)
+
+def llm_justification(extraction_result, assessment):
+    try:
+        prompt = build_verdict_prompt(extraction_result, assessment)
+        generated_text = generate(prompt, max_new_tokens=VERDICT_MAX_NEW_TOKENS)
+        if "### Analysis:" in generated_text:
+            return generated_text.split("### Analysis:")[-1].strip()
         else:
-            return f"Error: {response.status_code} - {response.text}"
-    
+            return generated_text.strip()
+
     except Exception as e:
-        return f"Error in risk_analysis_huggingface: {e}"
+        return f"Error in verdict: {e}"
 
 if __name__ == "__main__":
     extraction_result = {
@@ -220,10 +327,15 @@ if __name__ == "__main__":
             ],
             "Normalized Risk Score for all the countries involved": 22.69
         },
-        "Sectors associated with the entities extracted": {
+        "Sectors associated with Extracted Entities": {
             "Tesla Inc": "Motor Vehicles & Passenger Car Bodies",
             "Microsoft Corporation": "Services-Prepackaged Software"
         },
+        "Transaction Amount": 300000.0,
+        "Sanction Screening": {
+            "Tesla Inc": [],
+            "Microsoft Corporation": []
+        },
         "Sanction Analysis of the entitites involved": "Sanction Analysis:\n\nTesla Inc\n* Risk Score: 0.5\n* Justification and Evidence:\n    - Tesla Inc is a US-based company that designs, manufactures, and sells high-performance electric vehicles and energy products.\n    - The company has been subject to various sanctions and restrictions, including those imposed by the US government and other countries.\n    - For example, in 2018, Tesla was sanctioned by the US government for its business with North Korea, which was subject to economic sanctions.\n    - Additionally, in 2020, Tesla was fined $20 million by the US Securities and Exchange Commission for misstating the production numbers of its Model 3 electric car.\n    - While Tesla is not currently subject to any active sanctions, its history of violations and associations with countries subject to economic sanctions make it a potentially risky entity.\n\nMicrosoft Corporation\n* Risk Score: 0\n* Justification and Evidence:\n    - Microsoft Corporation is a US-based technology company that provides software, cloud services, and other products and services.\n    - The company has not been subject to any active sanctions or restrictions, and has a clean track record with respect to compliance with sanctions laws and regulations.\n    - Based on the available data, Microsoft Corporation appears to be a low-risk entity with no potential sanctions-related issues.\n\nOverall Risk Score (Sanction based):\n\n* Final Risk Level: 0.5\n* Confidence Level: 0.9\n* Justification: The overall risk score for this transaction is based on the risk scores of the two entities involved, Tesla Inc and Microsoft Corporation.\n* Tesla Inc has a risk score of 0.5, which reflects its history of violations and associations with countries subject to economic sanctions.\n* Microsoft Corporation has a risk score of 0, which reflects its clean track record with respect to compliance with sanctions laws and regulations.\n* Given the potential risks associated with Tesla Inc, it is recommended that the transaction involving this entity be flagged for further review and potentially cleared with additional due diligence and sanctions screening.\n* While Microsoft Corporation is considered a low-risk entity, it is important to note that the overall risk score for the transaction is still relatively high, and additional information and context may be needed to fully assess the risks involved."
     }
 